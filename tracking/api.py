@@ -1,38 +1,43 @@
 import pymongo
 import datetime
 import os
+import threading
 from device import iot_device
 from bson.objectid import ObjectId
+from sinks import EventSink
+from vehicle_writer import VehicleLogWriter
+from rollups import TrafficRollup, create_rollup_indexes, session_totals, device_counts
 
-class api_connection():
+class api_connection(EventSink):
     logged_count = 0
-    connection_string = os.environ.get("POETRY_CONN_STRING")
-    if connection_string == None:
-        raise ValueError("No valid connection string present, set connection string in POETRY_CONN_STRING")
-    client = pymongo.MongoClient(connection_string + "?retryWrites=true&w=majority")
-    db = client.development
+    # one pooled client per process, created on first use rather than at import
+    client = None
+    client_lock = threading.Lock()
     vehicles = []
 
+    @classmethod
+    def get_database(cls):
+        with cls.client_lock:
+            if cls.client is None:
+                connection_string = os.environ.get("POETRY_CONN_STRING")
+                if connection_string == None:
+                    raise ValueError("No valid connection string present, set connection string in POETRY_CONN_STRING")
+                cls.client = pymongo.MongoClient(connection_string + "?retryWrites=true&w=majority", maxPoolSize=10)
+        return cls.client.development
+
     def __init__(self, verbose):
-        self.verbose = verbose
+        super().__init__(verbose)
         self.verbose = True
+        self.db = self.get_database()
         self.device = iot_device()
         self.device_id = str(self.device.mac_address)
-        
-        device = self.db.devices.find_one({"_id": self.device_id})
-
-        if device == None:
-            print("Device was not found, please set up this device.")
-            device_name = input("Device Name: ")
-            location_string = input("Location: ")
-            device = {
-                "_id": str(self.device.mac_address),
-                "deviceName": device_name,
-                "location": location_string,
-                "lastUpdated": datetime.datetime.now(datetime.timezone.utc)
-            }
-            
-            self.db.devices.insert_one(device)
+
+        # register unknown devices from the environment, never prompting
+        self.db.devices.update_one({"_id": self.device_id}, {"$setOnInsert": {
+            "deviceName": self.device.name,
+            "location": self.device.location,
+            "lastUpdated": datetime.datetime.now(datetime.timezone.utc)
+        }}, upsert=True)
 
         time_started = datetime.datetime.now(datetime.timezone.utc)
         self.session = {"deviceId": self.device_id, "timeStarted": time_started}
@@ -40,24 +45,37 @@ class api_connection():
 
         print("Session #", self.session_id, " Started: ", time_started)
 
+        # per minute counts, flushed to the rollup collection alongside the vehicle batches
+        create_rollup_indexes(self.db.vehicleRollups)
+        self.rollup = TrafficRollup(self.session_id, self.device_id)
+
+        # vehicles are written in batches from a background thread
+        self.writer = VehicleLogWriter(self.db.vehicles, flush_hooks=[lambda: self.rollup.flush(self.db.vehicleRollups)])
+        self.writer.start()
+
     def insert_vehicle(self, vehicle):
-        self.db.vehicles.insert({"sessionId": ObjectId(self.session_id), "vehicleType": vehicle.class_name, 
-            "direction": vehicle.direction, "timeCrossed": vehicle.counted}, w=0)
+        super().insert_vehicle(vehicle)
+        self.writer.put({"sessionId": ObjectId(self.session_id), "vehicleType": vehicle.class_name, 
+            "direction": vehicle.direction, "timeCrossed": vehicle.counted})
+        self.rollup.add(vehicle)
+
+    def traffic_counts(self, start, end):
+        # vehicle counts per minute, class and direction for this device
+        return device_counts(self.db.vehicleRollups, self.device_id, start, end)
 
     def close(self):
+        # flush any buffered vehicles before the session summary is counted
+        self.writer.stop()
         time_ended = datetime.datetime.now(datetime.timezone.utc)
         self.db.deviceSessions.update_one({'_id': ObjectId(self.session_id)}, {"$set": {"timeEnded": time_ended}})
         
         if self.verbose == True:
-            total_up = self.db.vehicles.count_documents(
-                { "$and": [ { "direction":  "up" }, {"sessionId": self.session_id} ] }
-            )
-
-            total_down = self.db.vehicles.count_documents(
-                { "$and": [ { "direction":  "down" }, {"sessionId": self.session_id} ] }
-            ) 
+            totals = session_totals(self.db.vehicleRollups, self.session_id)
+            total_up = totals.get("up", 0)
+            total_down = totals.get("down", 0)
 
             print("Session #", self.session_id, " UP: ", total_up, " DOWN: ", total_down , " Ended: ", time_ended)
+            print("Vehicle Writer: ", self.writer.stats())
 
 
 
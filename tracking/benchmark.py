@@ -0,0 +1,169 @@
+import argparse
+import csv
+import json
+import sys
+import os
+import cv2
+from vehicle_tracker import VehicleTracker, TrackingSettings
+from tests_constants import SOURCE, CAR_CLASS, CAR_COUNT_ACTUAL, TRUCK_CLASS, TRUCK_COUNT_ACTUAL, MTRBIKE_CLASS, MTRBIKE_COUNT_ACTUAL
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak memory is left out of the report
+    resource = None
+
+# vehicles of each class crossing the line in the test clip, scored by count when there is no
+# per frame annotation of the clip
+TEST_CLIP_COUNTS = {CAR_CLASS: CAR_COUNT_ACTUAL, TRUCK_CLASS: TRUCK_COUNT_ACTUAL, MTRBIKE_CLASS: MTRBIKE_COUNT_ACTUAL}
+
+def load_ground_truth(path):
+    # csv with a header of frame,class,direction, one row per vehicle crossing
+    with open(path, newline="") as f:
+        return [(int(row["frame"]), row["class"], row["direction"]) for row in csv.DictReader(f)]
+
+def resolve_ground_truth(video_input, truth_path=None):
+    # the crossings of the truth file, or the class counts of the test clip when it has none.
+    # raises ValueError when neither is available
+    if truth_path is not None:
+        if not os.path.isfile(truth_path):
+            raise ValueError("ground truth file {} does not exist".format(truth_path))
+        return load_ground_truth(truth_path)
+    if os.path.abspath(video_input) == os.path.abspath(SOURCE):
+        return dict(TEST_CLIP_COUNTS)
+    raise ValueError("--truth is required for inputs other than {}".format(SOURCE))
+
+def match_crossings(detected, ground_truth, tolerance_frames):
+    # pair each true crossing with the closest unused detected crossing of the same class
+    # and direction within tolerance_frames, returns the matched (truth, detected) pairs
+    candidates = []
+    for (i, (truth_frame, truth_class, truth_direction)) in enumerate(ground_truth):
+        for (j, (frame, class_name, direction)) in enumerate(detected):
+            if class_name == truth_class and direction == truth_direction and abs(frame - truth_frame) <= tolerance_frames:
+                candidates.append((abs(frame - truth_frame), i, j))
+
+    matches = []
+    used_truth, used_detected = set(), set()
+    for (_, i, j) in sorted(candidates):
+        if i in used_truth or j in used_detected:
+            continue
+        used_truth.add(i)
+        used_detected.add(j)
+        matches.append((i, j))
+    return matches
+
+def scores(true_positives, detected_count, truth_count):
+    precision = true_positives / detected_count if detected_count > 0 else 0
+    recall = true_positives / truth_count if truth_count > 0 else 0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0
+    return {"truePositives": true_positives, "falsePositives": detected_count - true_positives,
+        "falseNegatives": truth_count - true_positives, "precision": precision, "recall": recall, "f1": f1}
+
+def accuracy_report(detected, ground_truth, tolerance_frames):
+    matches = match_crossings(detected, ground_truth, tolerance_frames)
+    classes = sorted({c for (_, c, _) in ground_truth} | {c for (_, c, _) in detected})
+
+    report = {"overall": scores(len(matches), len(detected), len(ground_truth)), "classes": {}}
+    for class_name in classes:
+        true_positives = sum(1 for (i, _) in matches if ground_truth[i][1] == class_name)
+        detected_count = sum(1 for (_, c, _) in detected if c == class_name)
+        truth_count = sum(1 for (_, c, _) in ground_truth if c == class_name)
+        report["classes"][class_name] = scores(true_positives, detected_count, truth_count)
+    return report
+
+def count_accuracy_report(detected, counts):
+    # without crossing frames only the counts can be compared, every detected crossing up to
+    # the true count of its class is taken as correct, whatever its frame and direction
+    classes = sorted(set(counts) | {c for (_, c, _) in detected})
+    class_scores = {}
+    for class_name in classes:
+        detected_count = sum(1 for (_, c, _) in detected if c == class_name)
+        truth_count = counts.get(class_name, 0)
+        class_scores[class_name] = scores(min(detected_count, truth_count), detected_count, truth_count)
+    true_positives = sum(values["truePositives"] for values in class_scores.values())
+    return {"overall": scores(true_positives, len(detected), sum(counts.values())), "classes": class_scores}
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def video_fps(video_input):
+    video_stream = cv2.VideoCapture(video_input)
+    fps = video_stream.get(cv2.CAP_PROP_FPS)
+    video_stream.release()
+    return fps if fps > 0 else 30
+
+def run_benchmark(settings: TrackingSettings, ground_truth, tolerance_seconds: float = 1.0):
+    # ground_truth is a list of crossings or a dict of class counts, see resolve_ground_truth.
+    # headless, nothing is displayed, prompted for or written to a database
+    settings.verbose = False
+    settings.testing = False
+    settings.sink = "memory"
+    settings.instrumentation = True
+
+    tracker = VehicleTracker(settings)
+    _, _, elapsed_time, average_fps = tracker.track()
+    frames = tracker.total_frames_processed
+
+    stages = {}
+    for (stage, values) in tracker.stage_timer.summary().items():
+        seconds = values["sum"]
+        stages[stage] = {"seconds": seconds, "msPerFrame": seconds * 1000 / frames if frames > 0 else 0,
+            "throughput": frames / seconds if seconds > 0 else None,
+            "percentilesMs": {str(quantile): value * 1000 for (quantile, value) in values["quantiles"].items()}}
+
+    crossings = [crossing[:3] for crossing in tracker.logger.crossings]
+    tolerance_frames = tolerance_seconds * video_fps(settings.video_input)
+    if isinstance(ground_truth, dict):
+        scoring, truth_count = "counts", sum(ground_truth.values())
+        accuracy = count_accuracy_report(crossings, ground_truth)
+    else:
+        scoring, truth_count = "crossings", len(ground_truth)
+        accuracy = accuracy_report(crossings, ground_truth, tolerance_frames)
+    return {
+        "settings": {"video_input": settings.video_input, "max_disappeared": settings.max_disappeared,
+            "skip_frames": settings.skip_frames, "y_roi": settings.y_roi, "max_width": settings.max_width},
+        "frames": frames,
+        "elapsedSeconds": elapsed_time,
+        "startupSeconds": tracker.startup_times,
+        "fps": average_fps,
+        "detections": tracker.total_detections,
+        "detectorCalls": tracker.detector_calls,
+        "cacheHits": tracker.detection_cache.hits if tracker.detection_cache is not None else 0,
+        "stages": stages,
+        "crossings": len(crossings),
+        "groundTruthCrossings": truth_count,
+        "scoring": scoring,
+        "toleranceFrames": tolerance_frames,
+        "accuracy": accuracy,
+        "peakMemoryMB": peak_memory_mb()
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless throughput and counting accuracy benchmark')
+    parser.add_argument('--input', type=str, default="../data/test-clip.mp4", help='The input video to benchmark on')
+    parser.add_argument('--truth', type=str, default=None, help='Ground truth crossings csv with frame,class,direction columns, the test clip is scored by its class counts without one')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Seconds a detected crossing may be from the true crossing')
+    parser.add_argument('--roi', type=int, default=90, help='Region of Interest Value (Y Cut Off)')
+    parser.add_argument('--skip', type=int, default=15, help='Number of skip frames')
+    parser.add_argument('--maxw', type=int, default=800, help='Max Width Value used to resize input frame')
+    parser.add_argument('--cache', action='store_true', help='Replay detections from the on disk detection cache, so only tracking settings are timed')
+    parser.add_argument('--report', type=str, default=None, help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+    try:
+        ground_truth = resolve_ground_truth(args.input, args.truth)
+    except ValueError as e:
+        parser.error(str(e))
+
+    settings = TrackingSettings(video_input=args.input, y_roi=args.roi, skip_frames=args.skip, max_width=args.maxw,
+        detection_cache=args.cache)
+    report = run_benchmark(settings, ground_truth, args.tolerance)
+
+    if args.report is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
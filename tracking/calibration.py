@@ -0,0 +1,119 @@
+import cv2
+import imutils
+import multiprocessing
+import time
+import numpy as np
+from classifier import yolov4, CONFIDENCE_THRESHOLD, NMS_THRESHOLD
+from detector_config import DetectorConfig, save_cached_config
+
+CANDIDATE_SIZES = [320, 416, 512]
+# the reference every candidate's detections are compared against
+REFERENCE_CONFIG = DetectorConfig(cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU, 416)
+CPU_TARGETS = [cv2.dnn.DNN_TARGET_CPU]
+CANDIDATE_BACKENDS = ["DNN_BACKEND_OPENCV", "DNN_BACKEND_INFERENCE_ENGINE", "DNN_BACKEND_VKCOM", "DNN_BACKEND_CUDA"]
+
+def sample_frames(settings, count: int = 20):
+    # spread the sample over the start of the input, cut the same way the tracker does
+    video_stream = cv2.VideoCapture(settings.video_input)
+    frames = []
+    while len(frames) < count:
+        (grabbed, frame) = video_stream.read()
+        if not grabbed:
+            break
+        frame = imutils.resize(frame, width=settings.max_width)
+        frames.append(frame[settings.y_roi:])
+        # skip ahead so the sample is not dominated by near identical frames
+        for _ in range(settings.skip_frames - 1):
+            video_stream.grab()
+    video_stream.release()
+    return frames
+
+def candidate_configs():
+    thread_counts = sorted({1, max(1, multiprocessing.cpu_count() // 2), multiprocessing.cpu_count()})
+    configs = []
+    # backends missing from this opencv build report no targets
+    backends = [getattr(cv2.dnn, name) for name in CANDIDATE_BACKENDS if hasattr(cv2.dnn, name)]
+    for backend in backends:
+        for target in cv2.dnn.getAvailableTargets(backend):
+            for input_size in CANDIDATE_SIZES:
+                # thread count only matters for targets running on the cpu
+                for threads in (thread_counts if target in CPU_TARGETS else [0]):
+                    configs.append(DetectorConfig(backend, target, input_size, threads))
+    return configs
+
+def box_iou(a, b):
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0
+
+def detection_agreement(reference, detections, iou_threshold: float = 0.5):
+    # f1 score of same class boxes matched greedily by iou
+    (ref_classes, _, ref_boxes) = reference
+    (classes, _, boxes) = detections
+    if len(ref_boxes) == 0 and len(boxes) == 0:
+        return 1.0
+
+    matched = 0
+    used = set()
+    for (ref_class, ref_box) in zip(np.ravel(ref_classes), ref_boxes):
+        best, best_iou = None, iou_threshold
+        for (i, (class_id, box)) in enumerate(zip(np.ravel(classes), boxes)):
+            if i in used or class_id != ref_class:
+                continue
+            iou = box_iou(ref_box, box)
+            if iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+            matched += 1
+
+    return 2 * matched / (len(ref_boxes) + len(boxes))
+
+def benchmark_config(config, frames, repeats: int = 1):
+    classifier = yolov4(config)
+    # first forward pass allocates and compiles, keep it out of the timing
+    classifier.model.detect(frames[0], CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+
+    detections = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        detections = [classifier.model.detect(frame, CONFIDENCE_THRESHOLD, NMS_THRESHOLD) for frame in frames]
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeats * len(frames)), detections
+
+def calibrate(settings, sample_size: int = 20, repeats: int = 2, min_agreement: float = 0.9, verbose: bool = True):
+    frames = sample_frames(settings, sample_size)
+    if len(frames) == 0:
+        raise ValueError("No frames could be read from {} for calibration".format(settings.video_input))
+
+    default_threads = cv2.getNumThreads()
+    _, reference = benchmark_config(REFERENCE_CONFIG, frames, 1)
+
+    results = []
+    best = None
+    for config in candidate_configs():
+        try:
+            latency, detections = benchmark_config(config, frames, repeats)
+        except cv2.error as e:
+            # backend listed as available but unusable on this machine
+            if verbose == True:
+                print("Calibration skipped {}: {}".format(config, e))
+            continue
+
+        agreement = np.mean([detection_agreement(r, d) for (r, d) in zip(reference, detections)])
+        results.append({"config": config.to_dict(), "latency": latency, "agreement": float(agreement)})
+        if verbose == True:
+            print("Calibration {}: {:.2f}ms, agreement {:.3f}".format(config, latency * 1000, agreement))
+
+        # fastest configuration whose detections still agree with the reference
+        if agreement >= min_agreement and (best is None or latency < best[1]):
+            best = (config, latency)
+
+    cv2.setNumThreads(default_threads)
+    config = best[0] if best is not None else REFERENCE_CONFIG
+    save_cached_config(config, results)
+    if verbose == True:
+        print("Calibrated detector configuration: {}".format(config))
+    return config
@@ -1,100 +1,105 @@
 import numpy as np
-from scipy.spatial import distance as dist
 from collections import OrderedDict
 
+# cost given to gated pairs so the optimal assignment never prefers them
+GATED_COST = 1e9
+
 # based from https://www.pyimagesearch.com/2018/07/23/simple-object-tracking-with-opencv/
+# tracker state is kept in parallel arrays so every update is a handful of numpy operations
 class CentroidTracker():
-    def __init__(self, max_disappeared=50):
+    def __init__(self, max_disappeared=50, max_distance=None, assignment="greedy"):
         self.next_vehicle_id = 0
-        self.vehicles = OrderedDict()
-        self.vehicle_classes = {}
-        self.disappeared = OrderedDict()
         self.max_disappeared = max_disappeared
+        # detections further than this from a vehicle can never take its id
+        self.max_distance = max_distance
+        self.assignment = assignment
+        # scipy takes around a second to import, so it is only loaded for optimal matching
+        self.linear_sum_assignment = None
+        if assignment == "optimal":
+            from scipy.optimize import linear_sum_assignment
+            self.linear_sum_assignment = linear_sum_assignment
+        self.ids = np.empty(0, dtype="int")
+        self.centroids = np.empty((0, 2), dtype="int")
+        self.disappeared = np.empty(0, dtype="int")
+        self.vehicle_classes = {}
+        # ids deregistered by the last update, so callers can drop their own state
+        self.deregistered = []
+
+    def register(self, class_ids, centroids):
+        new_ids = np.arange(self.next_vehicle_id, self.next_vehicle_id + len(centroids))
+        self.next_vehicle_id += len(centroids)
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.centroids = np.concatenate([self.centroids, centroids])
+        self.disappeared = np.concatenate([self.disappeared, np.zeros(len(centroids), dtype="int")])
+        self.vehicle_classes.update(zip(new_ids.tolist(), class_ids.tolist()))
 
-    def register(self, class_id, centroid):
-        self.vehicles[self.next_vehicle_id] = centroid
-        self.vehicle_classes[self.next_vehicle_id] = class_id
-        self.disappeared[self.next_vehicle_id] = 0
-        self.next_vehicle_id += 1
+    def deregister(self, mask):
+        for vehicle_id in self.ids[mask].tolist():
+            del self.vehicle_classes[vehicle_id]
+            self.deregistered.append(vehicle_id)
 
-    def deregister(self, vehicle_id):
-        del self.vehicles[vehicle_id]
-        del self.disappeared[vehicle_id]
+        keep = ~mask
+        self.ids = self.ids[keep]
+        self.centroids = self.centroids[keep]
+        self.disappeared = self.disappeared[keep]
+
+    @property
+    def vehicles(self):
+        # copied so callers keeping a centroid never see it change under them
+        return OrderedDict(zip(self.ids.tolist(), self.centroids.copy()))
 
     def update(self, rects):
+        self.deregistered = []
         if len(rects) == 0:
-            for vehicle_id in list(self.disappeared.keys()):
-                self.disappeared[vehicle_id] += 1
-                
-                if self.disappeared[vehicle_id] > self.max_disappeared:
-                    self.deregister(vehicle_id)
+            self.disappeared += 1
+            self.deregister(self.disappeared > self.max_disappeared)
+            return self.vehicles, self.vehicle_classes
+
+        # centroid points and labels for every bound from classification
+        rects = np.asarray(rects)
+        labels = rects[:, 0].astype("int")
+        input_centroids = ((rects[:, 1:3] + rects[:, 3:5]) / 2.0).astype("int")
 
+        # used when no vehicles being tracked
+        if len(self.ids) == 0:
+            self.register(labels, input_centroids)
             return self.vehicles, self.vehicle_classes
 
-        # initialize arrays
-        input_centroids = np.zeros((len(rects), 2), dtype="int")
-        labels = np.zeros((len(rects)), dtype="int")
+        # distance between pairs of object centroids and input centroids
+        D = np.linalg.norm(self.centroids[:, np.newaxis] - input_centroids[np.newaxis], axis=2)
+        rows, cols = self.__assign(D)
 
-        # for each bound from classification
-        for (i, (class_id, start_x, start_y, end_x, end_y)) in enumerate(rects):
-            # centroid points
-            cx = int((start_x + end_x) / 2.0)
-            cy = int((start_y + end_y) / 2.0)
-            # add centroid to input array 
-            # add label to labels array
-            input_centroids[i] = (cx, cy)
-            labels[i] = class_id
+        # set matched centroids, reset dis count
+        self.centroids[rows] = input_centroids[cols]
+        self.disappeared[rows] = 0
 
-        # used when no vehicles being tracked
-        if len(self.vehicles) == 0:
-            for i in range(0, len(input_centroids)):
-                self.register(labels[i], input_centroids[i])
+        # unmatched vehicles disappeared this frame, unmatched centroids are new vehicles
+        unused_rows = np.ones(D.shape[0], dtype="bool")
+        unused_rows[rows] = False
+        unused_cols = np.ones(D.shape[1], dtype="bool")
+        unused_cols[cols] = False
 
-        # vehicles are being tracked, try match centroids with previous points
-        else:
-            vehicle_ids = list(self.vehicles.keys())
-            vehicle_centroids = list(self.vehicles.values())
+        self.disappeared[unused_rows] += 1
+        self.deregister(self.disappeared > self.max_disappeared)
+        self.register(labels[unused_cols], input_centroids[unused_cols])
 
-            # distance between pairs of object centroids and input centroids
-            D = dist.cdist(np.array(vehicle_centroids), input_centroids)
-            # find smallest value in each row and sort row indexes on minimum value
-            # finding the smallest value in each column from sorted rows
+        # return the set of trackable vehicles
+        return self.vehicles, self.vehicle_classes
+
+    def __assign(self, D):
+        if self.assignment == "optimal":
+            cost = D if self.max_distance is None else np.where(D > self.max_distance, GATED_COST, D)
+            rows, cols = self.linear_sum_assignment(cost)
+        else:
+            # greedy, rows in order of their closest centroid, each column taken once by
+            # the first row that wants it
             rows = D.min(axis=1).argsort()
             cols = D.argmin(axis=1)[rows]
+            _, first = np.unique(cols, return_index=True)
+            first.sort()
+            rows, cols = rows[first], cols[first]
 
-            used_rows = set()
-            used_cols = set()
-            for (row, col) in zip(rows, cols):
-                if row in used_rows or col in used_cols:
-                    continue
-
-                # get the vehicle id, set centroid, reset dis count
-                vehicle_id = vehicle_ids[row]
-                self.vehicles[vehicle_id] = input_centroids[col]
-                self.disappeared[vehicle_id] = 0
-                # add vehicle points to used sets
-                used_rows.add(row)
-                used_cols.add(col)
-
-            # get unused vehicle centroids
-            unused_rows = set(range(0, D.shape[0])).difference(used_rows)
-            unused_cols = set(range(0, D.shape[1])).difference(used_cols)
-
-            # tracked centroids equal or greater than input centroids
-            # check if any vehicles disappeared
-            if D.shape[0] >= D.shape[1]:
-                for row in unused_rows:
-                    # increment dis count
-                    vehicle_id = vehicle_ids[row]
-                    self.disappeared[vehicle_id] += 1
-                    # check max frames disappeard for vehicle
-                    if self.disappeared[vehicle_id] > self.max_disappeared:
-                        self.deregister(vehicle_id)
-
-            # otherwise, register the centroid and label as new vehicle
-            else:
-                for col in unused_cols:
-                    self.register(labels[col], input_centroids[col])
-                    
-        # return the set of trackable vehicles
-        return self.vehicles, self.vehicle_classes
\ No newline at end of file
+        if self.max_distance is not None:
+            gated = D[rows, cols] <= self.max_distance
+            rows, cols = rows[gated], cols[gated]
+        return rows, cols
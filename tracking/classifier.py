@@ -1,4 +1,6 @@
 import cv2
+import numpy as np
+from detector_config import DetectorConfig, load_cached_config, CLASSES_PATH, WEIGHTS_PATH, MODEL_CONFIG_PATH
 
 # dnn constants
 CONFIDENCE_THRESHOLD = 0.3
@@ -9,13 +11,88 @@ class yolov4:
     class_names = []
     model = None
 
-    def __init__(self):
+    def __init__(self, config: DetectorConfig = None):
+        # use the calibrated configuration for this host when there is one
+        if config is None:
+            config = load_cached_config()
+        if config is None:
+            config = DetectorConfig()
+        self.config = config
+
         # dnn
-        with open("../data/classes.txt", "r") as f:
+        with open(CLASSES_PATH, "r") as f:
             self.class_names = [cname.strip() for cname in f.readlines()]
 
-        net = cv2.dnn.readNet("../data/yolov4-tiny.weights", "../data/yolov4-tiny.cfg")
-        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+        if config.threads > 0:
+            cv2.setNumThreads(config.threads)
+        net = cv2.dnn.readNet(WEIGHTS_PATH, MODEL_CONFIG_PATH)
+        net.setPreferableBackend(config.backend)
+        net.setPreferableTarget(config.target)
+        self.net = net
+        self.input_size = (config.input_size, config.input_size)
+        self.output_names = net.getUnconnectedOutLayersNames()
         self.model = cv2.dnn_DetectionModel(net)
-        self.model.setInputParams(size=(416, 416), scale=1/255, swapRB=True)
\ No newline at end of file
+        self.model.setInputParams(size=self.input_size, scale=1/255, swapRB=True)
+
+    def detect(self, image, confidence_threshold, nms_threshold, class_ids=None):
+        # model.detect on the raw output layers, only keeping boxes of class_ids when given
+        return self.detect_batch([image], confidence_threshold, nms_threshold, class_ids)[0]
+
+    def detect_batch(self, images, confidence_threshold, nms_threshold, class_ids=None):
+        # one forward pass over every image, same preprocessing as model.detect
+        blob = cv2.dnn.blobFromImages(images, 1/255, self.input_size, swapRB=True, crop=False)
+        self.net.setInput(blob)
+        outputs = self.net.forward(self.output_names)
+        # yolo layers give (batch, rows, cols), or (rows, cols) for a single image
+        outputs = [output.reshape(len(images), -1, output.shape[-1]) for output in outputs]
+
+        results = []
+        for (i, image) in enumerate(images):
+            detections = np.concatenate([output[i] for output in outputs])
+            (frame_height, frame_width) = image.shape[:2]
+            results.append(decode_detections(detections, frame_width, frame_height, confidence_threshold, nms_threshold, class_ids))
+        return results
+
+def decode_detections(detections, frame_width, frame_height, confidence_threshold, nms_threshold, allowed_classes=None):
+    # mirrors cv2.dnn_DetectionModel.detect for yolo outputs so both paths give the same boxes.
+    # boxes whose best class is not in allowed_classes are dropped before any box is built
+    scores = detections[:, 5:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    keep = confidences >= confidence_threshold
+    if allowed_classes is not None:
+        keep &= np.isin(class_ids, allowed_classes)
+    detections, class_ids, confidences = detections[keep], class_ids[keep], confidences[keep]
+
+    # relative centre boxes to clipped pixel (left, top, width, height) boxes
+    center_x = (detections[:, 0] * frame_width).astype(np.int32)
+    center_y = (detections[:, 1] * frame_height).astype(np.int32)
+    width = (detections[:, 2] * frame_width).astype(np.int32)
+    height = (detections[:, 3] * frame_height).astype(np.int32)
+    left = np.clip(center_x - width // 2, 0, frame_width - 1)
+    top = np.clip(center_y - height // 2, 0, frame_height - 1)
+    width = np.maximum(1, np.minimum(width, frame_width - left))
+    height = np.maximum(1, np.minimum(height, frame_height - top))
+    boxes = np.stack([left, top, width, height], axis=1)
+
+    indices = batched_nms(boxes, confidences, class_ids, confidence_threshold, nms_threshold)
+    return class_ids[indices].astype(np.int32), confidences[indices].astype(np.float32), boxes[indices].astype(np.int32)
+
+def batched_nms(boxes, confidences, class_ids, confidence_threshold, nms_threshold):
+    # non maximum suppression within each class in one call, kept indices ordered by class
+    # then confidence like a separate call per class
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    if hasattr(cv2.dnn, "NMSBoxesBatched"):
+        kept = cv2.dnn.NMSBoxesBatched(boxes.tolist(), confidences.tolist(), class_ids.tolist(),
+            confidence_threshold, nms_threshold)
+    else:
+        # older opencv, shift every class to its own area of the plane so boxes of different
+        # classes never overlap
+        offsets = class_ids.astype(np.int64) * int(boxes[:, :2].max() + boxes[:, 2:].max() + 1)
+        shifted = boxes.astype(np.int64)
+        shifted[:, 0] += offsets
+        shifted[:, 1] += offsets
+        kept = cv2.dnn.NMSBoxes(shifted.tolist(), confidences.tolist(), confidence_threshold, nms_threshold)
+    kept = np.array(kept, dtype=np.int64).reshape(-1)
+    return kept[np.argsort(class_ids[kept], kind="stable")]
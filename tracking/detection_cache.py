@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+CACHE_DIRECTORY = "../data/detection-cache"
+# rows for frames that were evaluated without giving any box, so they are not detected again
+NO_DETECTIONS = -1
+# rows for frames motion gating found static, the tracker keeps its current trackers
+STATIC_FRAME = -2
+# bytes hashed from the start, middle and end of a video to identify its content
+SAMPLE_SIZE = 1 << 20
+
+ENTRY_TYPE = np.dtype([("frame", np.int64), ("class_id", np.int32), ("score", np.float32), ("box", np.int32, (4,))])
+
+def video_fingerprint(path):
+    # hashing a sample of the file instead of all of it keeps opening a long recording cheap
+    size = os.path.getsize(path)
+    content_hash = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - SAMPLE_SIZE // 2), max(0, size - SAMPLE_SIZE)}):
+            f.seek(offset)
+            content_hash.update(f.read(SAMPLE_SIZE))
+    return content_hash.hexdigest()
+
+class DetectionCache():
+    # detector output per frame of a recorded video, one memory mapped array of rows sorted
+    # by frame per video and detection setup. new rows are kept in memory and merged on close
+    def __init__(self, video_input, settings, detector_config, confidence_threshold, nms_threshold,
+                        directory: str = CACHE_DIRECTORY, max_size_mb: float = 512):
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 * 1024
+        # everything that changes what the detector returns for a frame is part of the key
+        key = {"video": video_fingerprint(video_input), "max_width": settings.max_width, "y_roi": settings.y_roi,
+            "detector": detector_config.to_dict(), "confidence": confidence_threshold, "nms": nms_threshold,
+            "motion_gating": settings.motion_gating, "classes": list(settings.trackable_classes)}
+        if settings.motion_gating == True:
+            # a motion gated detection only sees what moved since the previous detection, so the
+            # frames detected on are part of the key. adaptive ones follow the tracks
+            if settings.adaptive == True:
+                key["schedule"] = {"min_skip": settings.min_skip, "max_skip": settings.max_skip,
+                    "max_disappeared": settings.max_disappeared, "max_distance": settings.max_distance,
+                    "assignment": settings.assignment, "tracking_backend": settings.tracking_backend,
+                    "refine_tracks": settings.refine_tracks}
+            else:
+                key["schedule"] = {"skip_frames": settings.skip_frames}
+            key["start_frame"] = settings.start_frame
+        self.key = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+        self.path = os.path.join(directory, self.key + ".npy")
+        self.entries = np.zeros(0, dtype=ENTRY_TYPE)
+        if os.path.exists(self.path):
+            try:
+                self.entries = np.load(self.path, mmap_mode="r")
+                # the modification time is the last use, least recently used files are evicted first
+                os.utime(self.path)
+            except (OSError, ValueError):
+                self.entries = np.zeros(0, dtype=ENTRY_TYPE)
+        self.frames = self.entries["frame"]
+        self.new_entries = []
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, frame_index):
+        # (classes, scores, boxes) as the detector returned them, None for a static frame
+        # or False when the frame is not cached
+        start, end = np.searchsorted(self.frames, [frame_index, frame_index + 1])
+        if start == end:
+            self.misses += 1
+            return False
+        self.hits += 1
+        rows = self.entries[start:end]
+        if rows["class_id"][0] == STATIC_FRAME:
+            return None
+        rows = rows[rows["class_id"] != NO_DETECTIONS]
+        return np.array(rows["class_id"]), np.array(rows["score"]), np.array(rows["box"])
+
+    def put(self, frame_index, detected) -> None:
+        if detected is None:
+            rows = np.zeros(1, dtype=ENTRY_TYPE)
+            rows["class_id"] = STATIC_FRAME
+        else:
+            classes, scores, boxes = detected
+            classes = np.ravel(classes)
+            rows = np.zeros(max(1, len(classes)), dtype=ENTRY_TYPE)
+            rows["class_id"] = NO_DETECTIONS
+            rows["class_id"][:len(classes)] = classes
+            rows["score"][:len(classes)] = np.ravel(scores)
+            rows["box"][:len(classes)] = np.reshape(boxes, (-1, 4))
+        rows["frame"] = frame_index
+        self.new_entries.append(rows)
+
+    def close(self) -> None:
+        if len(self.new_entries) == 0:
+            return
+        entries = np.concatenate([np.array(self.entries)] + self.new_entries)
+        entries = entries[np.argsort(entries["frame"], kind="stable")]
+        self.new_entries = []
+
+        # write then rename so a crash, or another process on the same video, never leaves
+        # a half written file. concurrent writers do not merge, the last one to finish wins
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(temp_path, "wb") as f:
+            np.save(f, entries)
+        os.replace(temp_path, self.path)
+        self.entries = np.load(self.path, mmap_mode="r")
+        self.frames = self.entries["frame"]
+        self.__evict()
+
+    def __evict(self) -> None:
+        # drop the least recently used videos until the cache fits, never the current one
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".npy") and path != self.path:
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        total = os.path.getsize(self.path) + sum(size for (_, size, _) in files)
+        for (_, size, path) in sorted(files):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
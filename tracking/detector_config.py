@@ -0,0 +1,68 @@
+import cv2
+import hashlib
+import json
+import os
+import socket
+
+CLASSES_PATH = "../data/classes.txt"
+WEIGHTS_PATH = "../data/yolov4-tiny.weights"
+MODEL_CONFIG_PATH = "../data/yolov4-tiny.cfg"
+CACHE_PATH = "../data/detector-cache.json"
+
+class DetectorConfig():
+    # defaults are the original hard coded CUDA FP16 setup at 416x416
+    def __init__(self, backend: int = cv2.dnn.DNN_BACKEND_CUDA, target: int = cv2.dnn.DNN_TARGET_CUDA_FP16,
+                        input_size: int = 416, threads: int = 0):
+        self.backend = int(backend)
+        self.target = int(target)
+        self.input_size = int(input_size)
+        # 0 leaves the opencv thread pool at its default size
+        self.threads = int(threads)
+
+    def __repr__(self):
+        return "backend: {}, target: {}, input_size: {}, threads: {}".format(self.backend, self.target, self.input_size, self.threads)
+
+    def to_dict(self):
+        return {"backend": self.backend, "target": self.target, "input_size": self.input_size, "threads": self.threads}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(backend=values["backend"], target=values["target"], input_size=values["input_size"], threads=values["threads"])
+
+def cache_key():
+    # a cached choice is only valid for the same host, model files and opencv build
+    model_hash = hashlib.sha1()
+    with open(MODEL_CONFIG_PATH, "rb") as f:
+        model_hash.update(f.read())
+    if os.path.exists(WEIGHTS_PATH):
+        model_hash.update(str(os.path.getsize(WEIGHTS_PATH)).encode())
+    return "{}:{}:{}".format(socket.gethostname(), model_hash.hexdigest(), cv2.__version__)
+
+def load_cached_config(path: str = CACHE_PATH):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f).get(cache_key())
+    except (OSError, ValueError):
+        return None
+    if entry is None:
+        return None
+    return DetectorConfig.from_dict(entry["config"])
+
+def save_cached_config(config: DetectorConfig, results=None, path: str = CACHE_PATH) -> None:
+    cache = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    cache[cache_key()] = {"config": config.to_dict(), "results": results or []}
+
+    # write then rename so a crash never leaves a half written cache
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(temp_path, path)
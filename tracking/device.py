@@ -1,6 +1,11 @@
+import os
+import socket
 import uuid
 
 class iot_device:
     def __init__(self):
         self.mac_address = uuid.getnode()
+        # registration details come from the environment so start up never waits on input
+        self.name = os.environ.get("POETRY_DEVICE_NAME", socket.gethostname())
+        self.location = os.environ.get("POETRY_DEVICE_LOCATION", "unknown")
         print("Device MAC Address: ", self.mac_address)
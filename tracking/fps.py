@@ -1,5 +1,5 @@
 # import the necessary packages
-import datetime
+import time
 
 class FPS:
 	def __init__(self):
@@ -9,21 +9,21 @@ class FPS:
 		self._total_seconds = 0
 
 	def start(self):
-		# start the timer
-		self._start = datetime.datetime.now()
+		# start the timer, monotonic so clock adjustments never skew the result
+		self._start = time.perf_counter()
 		return self
 	
 	def pause(self):    
 		# total seconds upto this point
-		now = datetime.datetime.now()
-		self._total_seconds += (now - self._start).total_seconds()
+		now = time.perf_counter()
+		self._total_seconds += now - self._start
 
 	def resume(self):
-		self._start = datetime.datetime.now()
+		self._start = time.perf_counter()
 
 	def stop(self):
 		# stop the timer
-		self._end = datetime.datetime.now()
+		self._end = time.perf_counter()
 
 	def update(self):
 		# increment the total number of frames examined during the
@@ -33,8 +33,30 @@ class FPS:
 	def elapsed(self):
 		# return the total number of seconds between the start and
 		# end interval
-		return (self._total_seconds + (self._end - self._start).total_seconds())
+		return (self._total_seconds + (self._end - self._start))
 
 	def fps(self):
 		# compute the (approximate) frames per second
-		return self._num_frames / self.elapsed()
\ No newline at end of file
+		return self._num_frames / self.elapsed()
+
+class StageTimer:
+	# total time spent in each named stage of the frame loop, on a monotonic clock
+	def __init__(self):
+		self._totals = {}
+		self._counts = {}
+
+	def start(self):
+		return time.perf_counter()
+
+	def lap(self, stage, start):
+		# record the time since start against stage, the returned time starts the next stage
+		now = time.perf_counter()
+		self._totals[stage] = self._totals.get(stage, 0) + (now - start)
+		self._counts[stage] = self._counts.get(stage, 0) + 1
+		return now
+
+	def totals(self):
+		return dict(self._totals)
+
+	def counts(self):
+		return dict(self._counts)
@@ -0,0 +1,135 @@
+import json
+import numpy as np
+
+# pixels a centroid has to be past a gate before it counts as being on the other side, so
+# a vehicle wobbling on the line is neither counted the wrong way nor twice
+GATE_MARGIN = 4
+
+class Gate():
+    # two points are a counting line, more are a closed polygon such as a lane area. a line
+    # counts directions[0] for vehicles crossing to its left, going from its first point to
+    # its last as seen on screen, and directions[1] to its right. a polygon counts
+    # directions[0] for vehicles entering it and directions[1] for vehicles leaving
+    def __init__(self, name, points, directions=None):
+        self.name = name
+        self.points = np.array(points, dtype=float).reshape(-1, 2)
+        if len(self.points) < 2:
+            raise ValueError("Gate {} needs at least two points".format(name))
+        self.closed = len(self.points) > 2
+        if directions is None:
+            directions = ["{} in".format(name), "{} out".format(name)] if self.closed else ["{} left".format(name), "{} right".format(name)]
+        self.directions = list(directions)
+        # edges as start points and vectors, polygons are closed back to their first point
+        ends = np.roll(self.points, -1, axis=0) if self.closed else self.points[1:]
+        self.starts = self.points[:len(ends)]
+        self.edges = ends - self.starts
+
+    def __repr__(self):
+        return "name: {}, points: {}, directions: {}".format(self.name, self.points.tolist(), self.directions)
+
+    def crossings(self, previous, current, margin: float = GATE_MARGIN):
+        # previous and current are (tracks, 2) centroid arrays, returns which tracks crossed,
+        # which of those crossed in directions[0], and which are clear of the gate
+        if self.closed:
+            return self.__polygon_crossings(previous, current, margin)
+        return self.__line_crossings(previous, current, margin)
+
+    def __line_crossings(self, previous, current, margin):
+        start, edge = self.starts[0], self.edges[0]
+        length = np.hypot(edge[0], edge[1])
+        # signed distances from the line, negative on its left
+        previous_side = cross(edge, previous - start) / length
+        current_side = cross(edge, current - start) / length
+        # the move only crossed the gate if the gate's end points are on either side of it
+        movement = current - previous
+        first_end = cross(movement, start - previous)
+        last_end = cross(movement, start + edge - previous)
+
+        settled = np.abs(current_side) >= margin
+        crossed = settled & (previous_side * current_side <= 0) & (first_end * last_end <= 0)
+        return crossed, current_side < 0, settled
+
+    def __polygon_crossings(self, previous, current, margin):
+        previous_inside = self.contains(previous)
+        current_inside = self.contains(current)
+        settled = self.distance(current) >= margin
+        crossed = settled & (previous_inside != current_inside)
+        return crossed, current_inside, settled
+
+    def contains(self, points):
+        # even odd ray casting against every edge at once
+        x, y = points[:, 0, np.newaxis], points[:, 1, np.newaxis]
+        start_x, start_y = self.starts[:, 0], self.starts[:, 1]
+        end_y = start_y + self.edges[:, 1]
+        straddles = (start_y > y) != (end_y > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            intersect_x = start_x + (y - start_y) * self.edges[:, 0] / self.edges[:, 1]
+        return np.count_nonzero(straddles & (x < intersect_x), axis=1) % 2 == 1
+
+    def distance(self, points):
+        # distance from every point to its closest edge
+        offsets = points[:, np.newaxis] - self.starts
+        lengths = np.maximum(np.einsum("ij,ij->i", self.edges, self.edges), 1e-9)
+        along = np.clip(np.einsum("nij,ij->ni", offsets, self.edges) / lengths, 0, 1)
+        closest = offsets - along[..., np.newaxis] * self.edges
+        return np.sqrt(np.einsum("nij,nij->ni", closest, closest)).min(axis=1)
+
+class GateCounter():
+    # counts tracks crossing any of the gates. each track keeps, per gate, the last position it
+    # was clear of that gate, so a crossing is from one side of the margin to the other
+    def __init__(self, gates, margin: float = GATE_MARGIN):
+        self.gates = gates
+        self.margin = margin
+        self.ids = np.empty(0, dtype="int")
+        self.anchors = np.empty((0, len(gates), 2))
+        # directions each gate counted every vehicle in, a line counts a vehicle once and a
+        # polygon at most once entering and once leaving
+        self.counted = [{} for _ in gates]
+        self.totals = {gate.name: {direction: 0 for direction in gate.directions} for gate in gates}
+
+    def update(self, ids, centroids):
+        # ids and centroids of every tracked vehicle after this frame, returns the crossings
+        # as (vehicle id, gate, direction)
+        centroids = np.asarray(centroids, dtype=float).reshape(-1, 2)
+        anchors = np.repeat(centroids[:, np.newaxis], len(self.gates), axis=1)
+        _, current_indices, previous_indices = np.intersect1d(ids, self.ids, assume_unique=True, return_indices=True)
+        anchors[current_indices] = self.anchors[previous_indices]
+
+        events = []
+        for (i, gate) in enumerate(self.gates):
+            crossed, first_direction, settled = gate.crossings(anchors[:, i], centroids, self.margin)
+            anchors[settled, i] = centroids[settled]
+            for index in np.flatnonzero(crossed):
+                vehicle_id = int(ids[index])
+                direction = gate.directions[0] if first_direction[index] else gate.directions[1]
+                counted = self.counted[i].setdefault(vehicle_id, set())
+                if len(counted) > 0 and (gate.closed == False or direction in counted):
+                    continue
+                counted.add(direction)
+                self.totals[gate.name][direction] += 1
+                events.append((vehicle_id, gate, direction))
+
+        self.ids = np.array(ids, dtype="int")
+        self.anchors = anchors
+        return events
+
+    def forget(self, vehicle_ids) -> None:
+        # called with the ids the centroid tracker deregistered
+        for counted in self.counted:
+            for vehicle_id in vehicle_ids:
+                counted.pop(vehicle_id, None)
+
+def cross(a, b):
+    # z of the cross product of 2d vectors, broadcast over rows
+    a, b = np.asarray(a), np.asarray(b)
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+def midline_gate(width, height):
+    # the original counting line across the middle of the frame
+    return Gate("midline", [(0, height // 2), (width, height // 2)], ["up", "down"])
+
+def load_gates(path):
+    # json list of {"name": ..., "points": [[x, y], ...], "directions": [...]} in the pixels
+    # of the resized frame, directions are optional
+    with open(path, "r") as f:
+        return [Gate(gate["name"], gate["points"], gate.get("directions")) for gate in json.load(f)]
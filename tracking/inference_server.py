@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+from classifier import yolov4
+from vehicle_tracker import VehicleTracker
+
+class DetectionRequest():
+    def __init__(self, image, confidence_threshold, nms_threshold, class_ids=None):
+        self.image = image
+        self.thresholds = (confidence_threshold, nms_threshold, None if class_ids is None else tuple(class_ids))
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class InferenceServer(threading.Thread):
+    # one shared network for every tracker in the process, requests from all streams are
+    # gathered for up to max_latency seconds and run as a single batched forward pass
+    def __init__(self, classifier: yolov4 = None, max_batch_size: int = 8, max_latency: float = 0.01):
+        super().__init__(daemon=True)
+        self.classifier = classifier if classifier is not None else yolov4()
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.stop_event = threading.Event()
+        self.total_batches = 0
+        self.total_requests = 0
+
+    def detect(self, image, confidence_threshold, nms_threshold, class_ids=None):
+        # same signature and results as classifier.detect, blocks until the batch ran
+        request = DetectionRequest(image, confidence_threshold, nms_threshold, class_ids)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            # collect more requests until the batch is full or the deadline passes
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.__run_batch(batch)
+
+    def __run_batch(self, batch):
+        # requests with different thresholds or classes cannot share the decode step
+        groups = {}
+        for request in batch:
+            groups.setdefault(request.thresholds, []).append(request)
+
+        for ((confidence_threshold, nms_threshold, class_ids), requests) in groups.items():
+            try:
+                images = [request.image for request in requests]
+                results = self.classifier.detect_batch(images, confidence_threshold, nms_threshold, class_ids)
+                for (request, result) in zip(requests, results):
+                    request.result = result
+            except Exception as e:
+                for request in requests:
+                    request.error = e
+            finally:
+                for request in requests:
+                    request.done.set()
+
+        self.total_batches += 1
+        self.total_requests += len(batch)
+
+    def average_batch_size(self):
+        if self.total_batches == 0:
+            return 0
+        return self.total_requests / self.total_batches
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+def track_streams(settings_list, max_batch_size: int = 8, max_latency: float = 0.01):
+    # run one tracker per stream on its own thread, all sharing a single inference server
+    server = InferenceServer(max_batch_size=max_batch_size, max_latency=max_latency)
+    server.start()
+
+    # a failing stream records its error instead of taking the others down with it
+    results = [None] * len(settings_list)
+    errors = [None] * len(settings_list)
+    def track_stream(i, settings):
+        try:
+            results[i] = VehicleTracker(settings, inference_server=server).track()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=track_stream, args=(i, settings)) for (i, settings) in enumerate(settings_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    server.stop()
+    return results, errors, server.average_batch_size()
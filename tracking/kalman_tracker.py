@@ -0,0 +1,176 @@
+import cv2
+import numpy as np
+
+# state of a track is (center x, center y, width, height, velocity x, velocity y), one frame per step
+TRANSITION = np.eye(6)
+TRANSITION[0, 4] = TRANSITION[1, 5] = 1
+# detections measure the box, refinement only the center
+BOX_MEASUREMENT = np.eye(4, 6)
+CENTER_MEASUREMENT = np.eye(2, 6)
+# variances in pixels
+PROCESS_NOISE = np.diag([1.0, 1.0, 1.0, 1.0, 0.25, 0.25])
+BOX_NOISE = np.diag([4.0, 4.0, 16.0, 16.0])
+CENTER_NOISE = np.diag([4.0, 4.0])
+# a new track's velocity is unknown until its second detection
+INITIAL_COVARIANCE = np.diag([4.0, 4.0, 16.0, 16.0, 100.0, 100.0])
+
+class KalmanTracker():
+    # follows every detected box between detections with a constant velocity kalman filter,
+    # predicted for all tracks at once. tracks are corrected by the boxes of each detection,
+    # and only tracks the filter is unsure about are refined by template matching
+    def __init__(self, min_iou: float = 0.2, refine: bool = True, max_uncertainty: float = 6.0,
+                        search_margin: int = 16, min_match: float = 0.5, min_texture: float = 4.0):
+        # detections overlapping a predicted box less than this are matched by distance instead
+        self.min_iou = min_iou
+        self.refine = refine
+        # position standard deviation in pixels over which a track is refined
+        self.max_uncertainty = max_uncertainty
+        # pixels around the predicted box searched for the track's template
+        self.search_margin = search_margin
+        self.min_match = min_match
+        # grayscale standard deviation a template needs, normalized matching of a flat crop
+        # scores 1.0 everywhere and would pull the track to the corner of its search window
+        self.min_texture = min_texture
+        self.states = np.empty((0, 6))
+        self.covariances = np.empty((0, 6, 6))
+        self.class_ids = np.empty(0, dtype="int")
+        self.hits = np.empty(0, dtype="int")
+        # grayscale crop of every track at its last detection, None when too flat to match
+        self.templates = []
+        self.refined = 0
+
+    def predict(self, frame):
+        # moves every track one frame on, returns the (class, left, top, right, bottom) boxes
+        self.__predict()
+        if self.refine == True and len(self.states) > 0:
+            self.__refine(frame)
+        return self.boxes()
+
+    def correct(self, frame, detections) -> None:
+        # detections are (class, (left, top, right, bottom)) boxes. tracks are matched to them by
+        # overlap or distance, unmatched detections start tracks and unmatched tracks end, as every
+        # detection replaces the trackers
+        self.__predict()
+        class_ids = np.array([class_id for (class_id, _) in detections], dtype="int")
+        rects = np.array([rect for (_, rect) in detections], dtype=float).reshape(-1, 4)
+        measurements = to_state_box(rects)
+
+        rows, cols = self.__match(rects)
+        states, covariances = self.__update(self.states[rows], self.covariances[rows], measurements[cols],
+            BOX_MEASUREMENT, BOX_NOISE)
+
+        new = np.ones(len(rects), dtype="bool")
+        new[cols] = False
+        new_states = np.zeros((np.count_nonzero(new), 6))
+        new_states[:, :4] = measurements[new]
+        self.states = np.concatenate([states, new_states])
+        self.covariances = np.concatenate([covariances, np.repeat(INITIAL_COVARIANCE[np.newaxis], len(new_states), axis=0)])
+        self.class_ids = np.concatenate([class_ids[cols], class_ids[new]])
+        self.hits = np.concatenate([self.hits[rows] + 1, np.ones(len(new_states), dtype="int")])
+
+        if self.refine == True:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            order = np.concatenate([cols, np.flatnonzero(new)])
+            templates = [crop(gray, rect) for rect in rects[order]]
+            self.templates = [template if template.size > 0 and template.std() >= self.min_texture else None
+                for template in templates]
+
+    def boxes(self):
+        rects = to_rect(self.states).astype(int).tolist()
+        return [(class_id, left, top, right, bottom) for (class_id, (left, top, right, bottom)) in zip(self.class_ids.tolist(), rects)]
+
+    def __predict(self) -> None:
+        self.states = self.states @ TRANSITION.T
+        self.covariances = TRANSITION @ self.covariances @ TRANSITION.T + PROCESS_NOISE
+
+    def __update(self, states, covariances, measurements, measurement, noise):
+        # the kalman correction for a batch of tracks, one matmul per step
+        residuals = measurements - states @ measurement.T
+        innovation = measurement @ covariances @ measurement.T + noise
+        gains = covariances @ measurement.T @ np.linalg.inv(innovation)
+        states = states + np.einsum("nij,nj->ni", gains, residuals)
+        covariances = (np.eye(6) - gains @ measurement) @ covariances
+        return states, covariances
+
+    def __match(self, rects):
+        # overlapping pairs cost under 1, pairs that do not overlap enough cost their center
+        # distance over the track's gate plus 1, within the gate they still match. the gate is
+        # the larger of the box diagonal and three position deviations, so a track whose
+        # velocity is still unknown finds its next detection
+        if len(self.states) == 0 or len(rects) == 0:
+            return np.empty(0, dtype="int"), np.empty(0, dtype="int")
+        overlaps = pairwise_iou(to_rect(self.states), rects)
+        centers = to_state_box(rects)[:, :2]
+        distances = np.linalg.norm(self.states[:, np.newaxis, :2] - centers, axis=2)
+        deviations = np.sqrt(self.covariances[:, 0, 0] + self.covariances[:, 1, 1])
+        gates = np.maximum(np.hypot(self.states[:, 2], self.states[:, 3]), 3 * deviations)
+        costs = np.where(overlaps >= self.min_iou, 1 - overlaps, 1 + distances / gates[:, np.newaxis])
+
+        # greedy, tracks in order of their cheapest detection, each detection taken once
+        rows = costs.min(axis=1).argsort()
+        cols = costs.argmin(axis=1)[rows]
+        _, first = np.unique(cols, return_index=True)
+        rows, cols = rows[first], cols[first]
+        keep = costs[rows, cols] <= 2
+        return rows[keep], cols[keep]
+
+    def __refine(self, frame) -> None:
+        uncertainty = np.sqrt(self.covariances[:, 0, 0] + self.covariances[:, 1, 1])
+        unsure = np.flatnonzero((self.hits < 2) | (uncertainty > self.max_uncertainty))
+        if len(unsure) == 0:
+            return
+
+        # the only image work on a tracking frame, and only for tracks that need it
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        (frame_height, frame_width) = gray.shape
+        centers, indices = [], []
+        for index in unsure:
+            template = self.templates[index]
+            if template is None:
+                continue
+            (template_height, template_width) = template.shape
+            if template_height < 4 or template_width < 4:
+                continue
+            (center_x, center_y) = self.states[index, :2]
+            left = int(max(0, center_x - template_width / 2 - self.search_margin))
+            top = int(max(0, center_y - template_height / 2 - self.search_margin))
+            right = int(min(frame_width, center_x + template_width / 2 + self.search_margin))
+            bottom = int(min(frame_height, center_y + template_height / 2 + self.search_margin))
+            if right - left < template_width or bottom - top < template_height:
+                continue
+
+            scores = cv2.matchTemplate(gray[top:bottom, left:right], template, cv2.TM_CCOEFF_NORMED)
+            (_, best, _, (x, y)) = cv2.minMaxLoc(scores)
+            if best >= self.min_match:
+                centers.append((left + x + template_width / 2, top + y + template_height / 2))
+                indices.append(index)
+
+        if len(indices) > 0:
+            self.states[indices], self.covariances[indices] = self.__update(self.states[indices],
+                self.covariances[indices], np.array(centers), CENTER_MEASUREMENT, CENTER_NOISE)
+            self.refined += len(indices)
+
+def to_state_box(rects):
+    # (left, top, right, bottom) to (center x, center y, width, height)
+    return np.column_stack([(rects[:, 0] + rects[:, 2]) / 2, (rects[:, 1] + rects[:, 3]) / 2,
+        rects[:, 2] - rects[:, 0], rects[:, 3] - rects[:, 1]])
+
+def to_rect(states):
+    half_width, half_height = states[:, 2] / 2, states[:, 3] / 2
+    return np.column_stack([states[:, 0] - half_width, states[:, 1] - half_height,
+        states[:, 0] + half_width, states[:, 1] + half_height])
+
+def pairwise_iou(a, b):
+    # intersection over union of every (left, top, right, bottom) box in a with every box in b
+    left = np.maximum(a[:, np.newaxis, 0], b[:, 0])
+    top = np.maximum(a[:, np.newaxis, 1], b[:, 1])
+    right = np.minimum(a[:, np.newaxis, 2], b[:, 2])
+    bottom = np.minimum(a[:, np.newaxis, 3], b[:, 3])
+    intersection = np.maximum(0, right - left) * np.maximum(0, bottom - top)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, np.newaxis] + area_b - intersection, 1e-9)
+
+def crop(image, rect):
+    (left, top, right, bottom) = [int(value) for value in rect]
+    return image[max(0, top):max(0, bottom), max(0, left):max(0, right)].copy()
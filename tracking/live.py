@@ -0,0 +1,126 @@
+import datetime
+import threading
+import time
+import cv2
+
+class SimulatedCamera():
+    # plays a recorded file back at its own frame rate, frames are skipped rather than delayed
+    # when nobody reads them in time, the way a camera keeps capturing. used to test live mode
+    def __init__(self, path, speed: float = 1.0):
+        self.capture = cv2.VideoCapture(path)
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.frame_interval = 1 / ((fps if fps > 0 else 30) * speed)
+        self.started = None
+        self.position = 0
+
+    def read(self):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        # frames whose time has already passed were captured by nobody
+        due = int((now - self.started) / self.frame_interval)
+        while self.position < due:
+            if self.capture.grab() == False:
+                return False, None
+            self.position += 1
+        time.sleep(max(0, self.started + self.position * self.frame_interval - now))
+        self.position += 1
+        return self.capture.read()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return self.capture.get(prop)
+
+    def release(self) -> None:
+        self.capture.release()
+
+class LatestFrameReader(threading.Thread):
+    # reads a camera on its own thread and keeps only the newest frame, so a tracker slower
+    # than the camera works on the present instead of a growing backlog. a lost stream is
+    # reopened with exponential backoff
+    def __init__(self, open_capture, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0,
+                        max_reconnects: int = None, verbose: bool = True):
+        super().__init__(daemon=True)
+        self.open_capture = open_capture
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        # give up after this many failed reconnects in a row, None keeps trying
+        self.max_reconnects = max_reconnects
+        self.verbose = verbose
+        self.condition = threading.Condition()
+        self.capture = open_capture()
+        self.frame = None
+        # wall clock and perf_counter time the current frame was read
+        self.frame_time = None
+        self.sequence = 0
+        self.read_sequence = 0
+        # capture time of the frame last handed out by read
+        self.capture_time = None
+        self.frames_captured = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.ended = False
+        self.stop_event = threading.Event()
+
+    def run(self):
+        failures = 0
+        while not self.stop_event.is_set():
+            ok, frame = self.capture.read() if self.capture.isOpened() else (False, None)
+            if ok == True:
+                failures = 0
+                now = (datetime.datetime.now(datetime.timezone.utc), time.perf_counter())
+                with self.condition:
+                    # the last frame was never read, it is replaced by this one
+                    if self.frame is not None and self.sequence != self.read_sequence:
+                        self.dropped += 1
+                    self.frame = frame
+                    self.frame_time = now
+                    self.sequence += 1
+                    self.frames_captured += 1
+                    self.condition.notify_all()
+                continue
+
+            # a file with a known length that was read to the end is finished, not lost
+            frame_count = self.capture.get(cv2.CAP_PROP_FRAME_COUNT)
+            if frame_count > 0 and self.capture.get(cv2.CAP_PROP_POS_FRAMES) >= frame_count:
+                break
+            if self.max_reconnects is not None and failures >= self.max_reconnects:
+                break
+            delay = min(self.reconnect_delay * 2 ** failures, self.max_reconnect_delay)
+            failures += 1
+            if self.verbose == True:
+                print("Stream lost, reconnecting in {:.1f}s".format(delay))
+            self.capture.release()
+            if self.stop_event.wait(delay):
+                break
+            self.capture = self.open_capture()
+            self.reconnects += 1
+
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    def read(self):
+        # waits for a frame newer than the last one read, (False, None) once the stream ended
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence != self.read_sequence or self.ended)
+            if self.sequence == self.read_sequence:
+                return False, None
+            self.read_sequence = self.sequence
+            self.capture_time = self.frame_time
+            return True, self.frame
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self) -> None:
+        self.stop_event.set()
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+        self.join()
+        self.capture.release()
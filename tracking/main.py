@@ -1,30 +1,113 @@
 import sys
 import argparse
-from vehicle_tracker import VehicleTracker, TrackingSettings
+import logging
+import time
+from sinks import SINK_TYPES
+from tracking_options import ASSIGNMENT_TYPES, TRACKING_BACKENDS
 from tests_constants import SOURCE, PERSON_CLASS, BUS_CLASS, BICYCLE_CLASS, CAR_CLASS, CAR_COUNT_ACTUAL, TRUCK_CLASS, TRUCK_COUNT_ACTUAL, MTRBIKE_CLASS, MTRBIKE_COUNT_ACTUAL, TOTAL_COUNT
 
 if __name__ == "__main__":
+    started = time.perf_counter()
     try:
         parser = argparse.ArgumentParser(description='Tracking Settings for Matthew Ball\'s tracking project')
-        parser.add_argument('--input', type=str, default="../data/test-clip.mp4", help='The input video or stream of traffic images')
+        parser.add_argument('--input', type=str, nargs='+', default=["../data/test-clip.mp4"], help='The input video or stream of traffic images, several inputs share one batched detector')
         parser.add_argument('--roi', type=int, default=90, help='Region of Interest Value (Y Cut Off)')
         parser.add_argument('--skip', type=int, default=15, help='Number of skip frames')
         parser.add_argument('--maxw', type=int, default=800, help='Max Width Value used to resize input frame')
         parser.add_argument('--verbose', type=bool, default=True, help='Verbose option, used to show the input frame, will increase performance when disabled')
         parser.add_argument('--testing', type=bool, default=False, help='Manual Testing Option, only works with default input video, enables Verbose mode')
+        parser.add_argument('--pipelined', action='store_true', help='Decode and preprocess frames on their own pipeline stages ahead of tracking')
+        parser.add_argument('--queue', type=int, default=8, help='Maximum number of frames buffered between pipeline stages')
+        parser.add_argument('--sink', type=str, default="mongo", choices=SINK_TYPES, help='Where counted vehicles are logged')
+        parser.add_argument('--sink-path', type=str, default=None, help='File used by the sqlite and jsonl sinks')
+        parser.add_argument('--assignment', type=str, default="greedy", choices=ASSIGNMENT_TYPES, help='How detections are matched to tracked vehicles')
+        parser.add_argument('--max-distance', type=float, default=None, help='Maximum centroid distance in pixels for a detection to keep a vehicle id')
+        parser.add_argument('--tracker', type=str, default="correlation", choices=TRACKING_BACKENDS, help='How vehicles are followed between detections')
+        parser.add_argument('--no-refine', action='store_true', help='Never template match uncertain tracks with the kalman tracker')
+        parser.add_argument('--workers', type=int, default=0, help='Worker processes for the correlation trackers, 0 updates them serially')
+        parser.add_argument('--adaptive', action='store_true', help='Schedule detection from tracker confidence and scene activity instead of every SKIP frames')
+        parser.add_argument('--min-skip', type=int, default=2, help='Fewest frames between detections in adaptive mode')
+        parser.add_argument('--max-skip', type=int, default=30, help='Most frames between detections in adaptive mode')
+        parser.add_argument('--motion', action='store_true', help='Skip detection on static frames and only detect in the area that moved')
+        parser.add_argument('--metrics', action='store_true', help='Log p50/p95/p99 latency of every frame loop stage')
+        parser.add_argument('--metrics-interval', type=float, default=10.0, help='Seconds between stage latency logs')
+        parser.add_argument('--metrics-port', type=int, default=None, help='Serve stage latencies in the Prometheus text format on this local port')
+        parser.add_argument('--cache', action='store_true', help='Replay detections of a recorded input from the on disk detection cache, detecting and caching the frames missing')
+        parser.add_argument('--cache-size', type=float, default=512, help='Size in MB the detection cache is kept under, least recently used videos are dropped first')
+        parser.add_argument('--gates', type=str, default=None, help='JSON file of counting lines and lane polygons, counts on the horizontal midline when not given')
+        parser.add_argument('--headless', action='store_true', help='Never open the local window, even when verbose')
+        parser.add_argument('--record', type=str, default=None, help='Record the annotated frames to this video file')
+        parser.add_argument('--preview-port', type=int, default=None, help='Serve the annotated frames as an MJPEG stream on this local port')
+        parser.add_argument('--live', action='store_true', help='Camera mode, always track the newest frame, drop the rest and reconnect a lost stream')
+        parser.add_argument('--simulate-live', action='store_true', help='Play a recorded input back in real time as if it was a live camera')
+        parser.add_argument('--calibrate', action='store_true', help='Benchmark detector backends, input sizes and threads on the input and cache the fastest')
         
         args = parser.parse_args()
+        if args.metrics == True:
+            logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
         if args.testing == True:
             args.verbose = True
-            args.input = "../data/test-clip.mp4"
+            args.input = ["../data/test-clip.mp4"]
+        if len(args.input) > 1:
+            # several streams run headless on their own threads around one shared detector
+            unsupported = [flag for (flag, used) in [("--pipelined", args.pipelined), ("--queue", args.queue != parser.get_default("queue")),
+                ("--record", args.record is not None), ("--preview-port", args.preview_port is not None),
+                ("--metrics-port", args.metrics_port is not None), ("--calibrate", args.calibrate)] if used]
+            if len(unsupported) > 0:
+                parser.error("{} only work with a single --input".format(", ".join(unsupported)))
 
-        settings = TrackingSettings(video_input = args.input, y_roi = args.roi, 
-            skip_frames = args.skip, max_width = args.maxw, verbose=args.verbose, testing=args.testing)
+        # opencv, numpy and the detector are only imported once the arguments are known to be valid
+        imports_started = time.perf_counter()
+        from vehicle_tracker import VehicleTracker, TrackingSettings
+        from gates import load_gates
+        imports_time = time.perf_counter() - imports_started
+        gates = load_gates(args.gates) if args.gates is not None else None
+
+        if len(args.input) > 1:
+            # one tracker per stream, detection batched across streams, no display windows
+            from inference_server import track_streams
+            settings_list = [TrackingSettings(video_input = video_input, y_roi = args.roi,
+                skip_frames = args.skip, max_width = args.maxw, verbose=False, sink=args.sink, sink_path=args.sink_path,
+                max_distance=args.max_distance, assignment=args.assignment, tracking_workers=args.workers,
+                adaptive=args.adaptive, min_skip=args.min_skip, max_skip=args.max_skip,
+                motion_gating=args.motion, instrumentation=args.metrics, metrics_interval=args.metrics_interval,
+                detection_cache=args.cache, cache_size_mb=args.cache_size, gates=gates,
+                live=args.live, simulate_live=args.simulate_live, tracking_backend=args.tracker, refine_tracks=not args.no_refine)
+                for video_input in args.input]
+            results, errors, average_batch_size = track_streams(settings_list)
+            for (settings, result, error) in zip(settings_list, results, errors):
+                print("Settings: " + str(settings))
+                if error is not None:
+                    print("Failed: {!r}".format(error))
+                    continue
+                (session_id, tracked_vehicles, elapsed_time, average_fps) = result
+                print("Elapsed Time: {}, FPS: {}".format(elapsed_time, average_fps))
+            print("Average Detection Batch Size: {}".format(average_batch_size))
+            sys.exit(1 if any(error is not None for error in errors) else 0)
+
+        settings = TrackingSettings(video_input = args.input[0], y_roi = args.roi, 
+            skip_frames = args.skip, max_width = args.maxw, verbose=args.verbose, testing=args.testing,
+            pipelined=args.pipelined, queue_size=args.queue, sink=args.sink, sink_path=args.sink_path,
+            max_distance=args.max_distance, assignment=args.assignment, tracking_workers=args.workers,
+            adaptive=args.adaptive, min_skip=args.min_skip, max_skip=args.max_skip, motion_gating=args.motion,
+            instrumentation=args.metrics, metrics_interval=args.metrics_interval, metrics_port=args.metrics_port,
+            detection_cache=args.cache, cache_size_mb=args.cache_size, gates=gates,
+            display=False if args.headless == True else None, record_path=args.record, preview_port=args.preview_port,
+            live=args.live, simulate_live=args.simulate_live, tracking_backend=args.tracker, refine_tracks=not args.no_refine)
+        if args.calibrate == True:
+            from calibration import calibrate
+            calibrate(settings)
         tracker = VehicleTracker(settings) 
+        startup = tracker.startup_times
+        print("Startup: imports {:.2f}s, {}, ready after {:.2f}s".format(imports_time,
+            ", ".join("{} {:.2f}s".format(name, seconds) for (name, seconds) in startup.items() if name != "total"),
+            time.perf_counter() - started))
         
         session_id, tracked_vehicles, elapsed_time, average_fps = tracker.track()
         print("Settings: " + str(settings))
-        print("Elapsed Time: {}, FPS: {}".format(elapsed_time, average_fps))
+        print("Elapsed Time: {}, FPS: {}, Detections: {}, Detector Calls: {}".format(elapsed_time, average_fps,
+            tracker.total_detections, tracker.detector_calls))
+        print("Time To First Frame: {:.2f}s".format(tracker.startup_times.get("first_frame", 0)))
 
         if args.testing == True:
             total_detected_count = len(tracked_vehicles)
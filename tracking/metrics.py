@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from fps import StageTimer
+
+QUANTILES = [0.5, 0.95, 0.99]
+logger = logging.getLogger("tracking.metrics")
+
+class NullStageTimer():
+    # instrumentation switched off, every call is a no op
+    def start(self):
+        return 0
+
+    def lap(self, stage, start):
+        return 0
+
+    def tick(self) -> None:
+        pass
+
+    def totals(self):
+        return {}
+
+    def counts(self):
+        return {}
+
+    def close(self) -> None:
+        pass
+
+class StageMetrics(StageTimer):
+    # stage totals plus the last window samples of every stage, summarised as
+    # p50/p95/p99 every emit_interval seconds to the log and on the metrics endpoint
+    def __init__(self, window: int = 1024, emit_interval: float = 10.0, port: int = None):
+        super().__init__()
+        self.window = window
+        self.emit_interval = emit_interval
+        self.samples = {}
+        self.positions = {}
+        self.last_emit = time.monotonic()
+        self.server = None
+        if port is not None:
+            self.server = MetricsServer(self, port)
+            self.server.start()
+
+    def lap(self, stage, start):
+        now = super().lap(stage, start)
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples.setdefault(stage, np.zeros(self.window))
+        # ring buffer, the oldest sample is overwritten
+        position = self.positions.get(stage, 0)
+        samples[position % self.window] = now - start
+        self.positions[stage] = position + 1
+        return now
+
+    def summary(self):
+        summary = {}
+        totals = self.totals()
+        counts = self.counts()
+        for (stage, samples) in list(self.samples.items()):
+            filled = samples[:min(self.positions[stage], self.window)]
+            quantiles = np.quantile(filled, QUANTILES)
+            summary[stage] = {"count": counts.get(stage, 0), "sum": totals.get(stage, 0),
+                "quantiles": dict(zip(QUANTILES, quantiles.tolist()))}
+        return summary
+
+    def tick(self) -> None:
+        # called once per frame, cheap unless an emit is due
+        now = time.monotonic()
+        if now - self.last_emit >= self.emit_interval:
+            self.last_emit = now
+            self.emit()
+
+    def emit(self) -> None:
+        for (stage, values) in sorted(self.summary().items()):
+            quantiles = values["quantiles"]
+            logger.info("stage %s p50 %.2fms p95 %.2fms p99 %.2fms count %d", stage,
+                quantiles[0.5] * 1000, quantiles[0.95] * 1000, quantiles[0.99] * 1000, values["count"])
+
+    def prometheus(self):
+        lines = ["# HELP tracking_stage_seconds Time spent in each stage of the frame loop",
+            "# TYPE tracking_stage_seconds summary"]
+        for (stage, values) in sorted(self.summary().items()):
+            for (quantile, seconds) in values["quantiles"].items():
+                lines.append('tracking_stage_seconds{{stage="{}",quantile="{}"}} {:.9f}'.format(stage, quantile, seconds))
+            lines.append('tracking_stage_seconds_sum{{stage="{}"}} {:.9f}'.format(stage, values["sum"]))
+            lines.append('tracking_stage_seconds_count{{stage="{}"}} {}'.format(stage, values["count"]))
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        self.emit()
+        if self.server is not None:
+            self.server.stop()
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server only has ThreadingHTTPServer from python 3.7
+    daemon_threads = True
+
+class MetricsServer(threading.Thread):
+    # serves the prometheus text format on http://127.0.0.1:port/metrics
+    def __init__(self, metrics, port: int):
+        super().__init__(daemon=True)
+        metrics_source = metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_source.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadedHTTPServer(("127.0.0.1", port), MetricsHandler)
+
+    def run(self):
+        self.http_server.serve_forever()
+
+    def stop(self) -> None:
+        self.http_server.shutdown()
+        self.http_server.server_close()
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+class MotionDetector():
+    # background subtraction on a small grayscale copy of every frame. the foreground is
+    # accumulated between detections and turned into merged regions worth detecting in
+    def __init__(self, scale: float = 0.25, min_area: int = 200, padding: int = 24, min_size: int = 96, full_frame_ratio: float = 0.5):
+        self.scale = scale
+        # smallest moving area in full frame pixels, smaller blobs are noise
+        self.min_area = min_area
+        self.padding = padding
+        # crops are grown to at least this size so the detector still sees some context
+        self.min_size = min_size
+        # when the moving regions cover this much of the frame detect on all of it
+        self.full_frame_ratio = full_frame_ratio
+        self.background = cv2.createBackgroundSubtractorMOG2(history=300, varThreshold=25, detectShadows=False)
+        self.kernel = np.ones((3, 3), dtype=np.uint8)
+        self.motion_mask = None
+        self.frame_shape = None
+
+    def apply(self, frame) -> None:
+        self.frame_shape = frame.shape[:2]
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        mask = self.background.apply(gray)
+        if self.motion_mask is None or self.motion_mask.shape != mask.shape:
+            self.motion_mask = mask
+        else:
+            cv2.bitwise_or(self.motion_mask, mask, dst=self.motion_mask)
+
+    def regions(self):
+        # (left, top, width, height) regions in frame coordinates, empty when nothing moved
+        if self.motion_mask is None:
+            return []
+
+        mask = cv2.dilate(self.motion_mask, self.kernel, iterations=2)
+        self.motion_mask = None
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2:]
+
+        min_area = self.min_area * self.scale * self.scale
+        boxes = [cv2.boundingRect(contour) for contour in contours if cv2.contourArea(contour) >= min_area]
+        boxes = [self.__to_frame(box) for box in boxes]
+        return merge_regions(boxes)
+
+    def covers_frame(self, regions):
+        (frame_height, frame_width) = self.frame_shape
+        area = sum(width * height for (_, _, width, height) in regions)
+        return area >= self.full_frame_ratio * frame_width * frame_height
+
+    def __to_frame(self, box):
+        # back to full size, padded, grown to min_size and clipped to the frame
+        (frame_height, frame_width) = self.frame_shape
+        (x, y, width, height) = [int(value / self.scale) for value in box]
+        center_x, center_y = x + width // 2, y + height // 2
+        width = max(width + 2 * self.padding, self.min_size)
+        height = max(height + 2 * self.padding, self.min_size)
+        left = min(max(0, center_x - width // 2), max(0, frame_width - width))
+        top = min(max(0, center_y - height // 2), max(0, frame_height - height))
+        return (left, top, min(width, frame_width - left), min(height, frame_height - top))
+
+def bounding_region(boxes):
+    # the smallest (left, top, width, height) box holding every box
+    left = min(box[0] for box in boxes)
+    top = min(box[1] for box in boxes)
+    right = max(box[0] + box[2] for box in boxes)
+    bottom = max(box[1] + box[3] for box in boxes)
+    return (left, top, right - left, bottom - top)
+
+def merge_regions(boxes):
+    # union overlapping boxes until none overlap, so no area is detected twice
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                (ax, ay, aw, ah), (bx, by, bw, bh) = boxes[i], boxes[j]
+                if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                    left, top = min(ax, bx), min(ay, by)
+                    right, bottom = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                    boxes[i] = (left, top, right - left, bottom - top)
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
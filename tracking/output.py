@@ -0,0 +1,174 @@
+import queue
+import threading
+import cv2
+import numpy as np
+from http.server import BaseHTTPRequestHandler
+from metrics import ThreadedHTTPServer
+
+# marks the end of the frames given to the renderer
+END_OF_OUTPUT = object()
+
+class WindowOutput():
+    # the local "Frame" window, pressing q asks the tracker to stop
+    def write(self, frame):
+        cv2.imshow("Frame", frame)
+        key = cv2.waitKey(1) & 0xFF
+        return key == ord("q")
+
+    def close(self) -> None:
+        cv2.destroyAllWindows()
+
+class RecordingOutput():
+    # annotated frames written to a video file, opened on the first frame to get its size
+    def __init__(self, path, fps: float = 30, fourcc: str = "mp4v"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def write(self, frame):
+        if self.writer is None:
+            (height, width) = frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (width, height))
+        self.writer.write(frame)
+        return False
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.release()
+
+class MjpegOutput():
+    # serves the latest annotated frame as an mjpeg stream on http://127.0.0.1:port/, frames
+    # are only encoded while someone is watching
+    def __init__(self, port: int, quality: int = 70):
+        self.quality = quality
+        self.condition = threading.Condition()
+        self.jpeg = None
+        self.sequence = 0
+        self.clients = 0
+        self.closed = False
+        output = self
+
+        class PreviewHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/":
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                with output.condition:
+                    output.clients += 1
+                try:
+                    sequence = 0
+                    while True:
+                        with output.condition:
+                            output.condition.wait_for(lambda: output.sequence != sequence or output.closed, timeout=1.0)
+                            if output.closed:
+                                return
+                            if output.sequence == sequence:
+                                continue
+                            sequence, jpeg = output.sequence, output.jpeg
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n")
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with output.condition:
+                        output.clients -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadedHTTPServer(("127.0.0.1", port), PreviewHandler)
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        if self.clients == 0:
+            return False
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            with self.condition:
+                self.jpeg = jpeg.tobytes()
+                self.sequence += 1
+                self.condition.notify_all()
+        return False
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+class AnnotationRenderer(threading.Thread):
+    # draws the tracked vehicles and gates onto frames and hands them to the outputs behind the
+    # frame loop. the queue only holds the newest frames, when rendering falls behind the
+    # oldest waiting frame is dropped so the tracker never waits on it
+    def __init__(self, outputs, gates, queue_size: int = 2):
+        super().__init__(daemon=True)
+        self.outputs = outputs
+        self.gates = gates
+        self.frames = queue.Queue(maxsize=queue_size)
+        # set when an output, such as q pressed in the window, asks the tracker to stop
+        self.quit_requested = False
+        self.rendered = 0
+        self.dropped = 0
+        self.error = None
+
+    def submit(self, frame, vehicles) -> None:
+        # vehicles are (id, label, centroid) tuples, the frame must not be changed afterwards
+        item = (frame, vehicles)
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.frames.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def run(self):
+        try:
+            while True:
+                item = self.frames.get()
+                if item is END_OF_OUTPUT:
+                    break
+                (frame, vehicles) = item
+                draw_annotations(frame, vehicles, self.gates)
+                for output in self.outputs:
+                    if output.write(frame) == True:
+                        self.quit_requested = True
+                self.rendered += 1
+        except Exception as e:
+            self.error = e
+            self.quit_requested = True
+        finally:
+            for output in self.outputs:
+                output.close()
+
+    def stop(self) -> None:
+        # frames still waiting are rendered first, so a recording is complete
+        while self.is_alive():
+            try:
+                self.frames.put(END_OF_OUTPUT, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+def draw_annotations(frame, vehicles, gates) -> None:
+    for gate in gates:
+        cv2.polylines(frame, [gate.points.astype(np.int32)], gate.closed, (0, 255, 255), 2)
+    for (vehicle_id, label, centroid) in vehicles:
+        text = "ID {} {}".format(vehicle_id, label)
+        cv2.putText(frame, text, (centroid[0] - 10, centroid[1] - 10),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        cv2.circle(frame, (centroid[0], centroid[1]), 4, (0, 255, 0), -1)
@@ -0,0 +1,112 @@
+import multiprocessing
+import time
+import dlib
+import numpy as np
+
+# workers start on the first frame, when the renderer, pipeline, metrics and database threads may
+# already be running. a forked child only gets the forking thread and can deadlock on a lock one
+# of the others held, so workers are spawned as fresh interpreters that import just this module
+CONTEXT = multiprocessing.get_context("spawn")
+
+def tracker_worker(connection, frame_buffer, frame_shape):
+    # the frame is read straight out of shared memory, only boxes cross the pipe
+    frame = np.frombuffer(frame_buffer, dtype=np.uint8).reshape(frame_shape)
+    trackers = []
+    while True:
+        message = connection.recv()
+        if message[0] == "start":
+            trackers = []
+            for (index, class_id, (left, top, right, bottom)) in message[1]:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(frame, dlib.rectangle(left, top, right, bottom))
+                trackers.append((index, class_id, tracker))
+            connection.send(None)
+        elif message[0] == "update":
+            start = time.perf_counter()
+            results = []
+            for (index, class_id, tracker) in trackers:
+                # update returns the peak to side lobe ratio, how confident the tracker is
+                confidence = tracker.update(frame)
+                position = tracker.get_position()
+                results.append((index, class_id, int(position.left()), int(position.top()),
+                    int(position.right()), int(position.bottom()), confidence))
+            connection.send((results, time.perf_counter() - start))
+        else:
+            break
+
+class ParallelCorrelationTracker():
+    # dlib correlation trackers spread round robin over worker processes. each frame is
+    # copied once into a shared buffer that every worker reads in place
+    def __init__(self, workers: int = multiprocessing.cpu_count()):
+        self.workers = workers
+        self.frame_shape = None
+        self.frame = None
+        self.processes = []
+        self.connections = []
+        # wall time of parallel updates against the summed worker time, which is what the
+        # serial path would have spent
+        self.wall_seconds = 0
+        self.worker_seconds = 0
+
+    def __start_workers(self, frame_shape):
+        self.close()
+        self.frame_shape = frame_shape
+        frame_buffer = CONTEXT.RawArray("B", int(np.prod(frame_shape)))
+        self.frame = np.frombuffer(frame_buffer, dtype=np.uint8).reshape(frame_shape)
+        for _ in range(self.workers):
+            (parent_connection, child_connection) = CONTEXT.Pipe()
+            process = CONTEXT.Process(target=tracker_worker, args=(child_connection, frame_buffer, frame_shape), daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.connections.append(parent_connection)
+
+    def __share_frame(self, rgb_frame):
+        if self.frame_shape != rgb_frame.shape:
+            self.__start_workers(rgb_frame.shape)
+        np.copyto(self.frame, rgb_frame)
+
+    def start(self, rgb_frame, detections) -> None:
+        # detections are (class_id, (left, top, right, bottom)) in detection order
+        self.__share_frame(rgb_frame)
+        indexed = [(index, class_id, box) for (index, (class_id, box)) in enumerate(detections)]
+        for (worker, connection) in enumerate(self.connections):
+            connection.send(("start", indexed[worker::self.workers]))
+        for connection in self.connections:
+            connection.recv()
+
+    def update(self, rgb_frame):
+        if self.frame is None:
+            return [], []
+
+        start = time.perf_counter()
+        self.__share_frame(rgb_frame)
+        for connection in self.connections:
+            connection.send(("update",))
+
+        results = []
+        for connection in self.connections:
+            (worker_results, worker_seconds) = connection.recv()
+            results.extend(worker_results)
+            self.worker_seconds += worker_seconds
+        self.wall_seconds += time.perf_counter() - start
+
+        # back in detection order whatever worker handled each tracker
+        results.sort(key=lambda result: result[0])
+        bounding_boxes = [result[1:6] for result in results]
+        confidences = [result[6] for result in results]
+        return bounding_boxes, confidences
+
+    def speedup(self):
+        if self.wall_seconds == 0:
+            return 0
+        return self.worker_seconds / self.wall_seconds
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send(("stop",))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.connections = []
+        self.frame_shape = None
+        self.frame = None
@@ -0,0 +1,96 @@
+import queue
+import threading
+
+# marks the end of the frame stream between stages
+END_OF_STREAM = object()
+# how long a blocked stage waits before re checking the stop flag
+POLL_SECONDS = 0.1
+
+class PipelineStage(threading.Thread):
+    def __init__(self, work, input_queue, output_queue, stop_event):
+        super().__init__(daemon=True)
+        self.work = work
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stop_event = stop_event
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                item = get_item(self.input_queue, self.stop_event)
+                if item is END_OF_STREAM:
+                    break
+                put_item(self.output_queue, self.work(item), self.stop_event)
+        except Exception as e:
+            self.error = e
+        finally:
+            put_item(self.output_queue, END_OF_STREAM, self.stop_event)
+
+class SourceStage(PipelineStage):
+    def __init__(self, read, output_queue, stop_event):
+        super().__init__(None, None, output_queue, stop_event)
+        self.read = read
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                item = self.read()
+                if item is None:
+                    break
+                put_item(self.output_queue, item, self.stop_event)
+        except Exception as e:
+            self.error = e
+        finally:
+            put_item(self.output_queue, END_OF_STREAM, self.stop_event)
+
+class FramePipeline():
+    # decode and preprocess run on their own threads, connected by bounded queues so a
+    # slow consumer blocks the producers instead of buffering frames without limit.
+    # each stage is a single thread reading a FIFO queue, so frame order is preserved.
+    # tracking runs on the thread iterating the pipeline
+    def __init__(self, read_frame, process_frame, queue_size: int = 8):
+        self.stop_event = threading.Event()
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.processed = queue.Queue(maxsize=queue_size)
+        self.stages = [
+            SourceStage(read_frame, self.decoded, self.stop_event),
+            PipelineStage(process_frame, self.decoded, self.processed, self.stop_event)
+        ]
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def __iter__(self):
+        while not self.stop_event.is_set():
+            item = get_item(self.processed, self.stop_event)
+            if item is END_OF_STREAM:
+                break
+            yield item
+
+    def stop(self):
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+def get_item(stage_queue, stop_event):
+    while not stop_event.is_set():
+        try:
+            return stage_queue.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return END_OF_STREAM
+
+def put_item(stage_queue, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
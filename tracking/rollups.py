@@ -0,0 +1,126 @@
+import datetime
+import os
+import threading
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo import UpdateOne, ASCENDING
+from pymongo.errors import PyMongoError, BulkWriteError
+from vehicle_writer import DUPLICATE_KEY_ERROR
+
+ROLLUP_SPOOL_PATH = "../data/rollup-spool.jsonl"
+# every rollup in the process spools to the same file
+spool_lock = threading.Lock()
+# spooled buckets read back as the utc datetimes they were written from
+SPOOL_JSON_OPTIONS = json_util.JSONOptions(tz_aware=True, tzinfo=datetime.timezone.utc)
+
+class TrafficRollup():
+    # in memory vehicle counts per (time bucket, vehicle class, direction), pushed to the
+    # rollup collection with $inc upserts so summaries read buckets instead of vehicles.
+    # counts that could not be written are spooled next to the vehicle spool and retried
+    def __init__(self, session_id, device_id, bucket_seconds: int = 60, spool_path: str = ROLLUP_SPOOL_PATH):
+        self.session_id = session_id
+        self.device_id = device_id
+        self.bucket_seconds = bucket_seconds
+        self.spool_path = spool_path
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def bucket_start(self, timestamp):
+        seconds = int(timestamp.timestamp()) // self.bucket_seconds * self.bucket_seconds
+        return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+    def add(self, vehicle) -> None:
+        key = (self.bucket_start(vehicle.counted), vehicle.class_name, vehicle.direction)
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + 1
+
+    def flush(self, collection) -> None:
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        # each increment gets an id when it leaves memory and keeps it through every retry
+        increments = [{"opId": ObjectId(), "sessionId": self.session_id, "deviceId": self.device_id, "bucket": bucket,
+            "vehicleType": class_name, "direction": direction, "count": count}
+            for ((bucket, class_name, direction), count) in pending.items()]
+
+        with spool_lock:
+            spooled = self.__read_spool()
+            if len(spooled) > 0:
+                spooled = write_increments(collection, spooled)
+            # spooled increments go first, while they fail the new ones are not tried
+            if len(spooled) == 0 and len(increments) > 0:
+                increments = write_increments(collection, increments)
+            self.__write_spool(spooled + increments)
+
+    def __read_spool(self):
+        if not os.path.exists(self.spool_path):
+            return []
+        increments = []
+        with open(self.spool_path, "r") as f:
+            for line in f:
+                try:
+                    increments.append(json_util.loads(line, json_options=SPOOL_JSON_OPTIONS))
+                except ValueError:
+                    # a line torn by a crash mid write, nothing to recover
+                    continue
+        return increments
+
+    def __write_spool(self, increments) -> None:
+        # the spool is replaced as a whole, it only ever holds increments still to be written
+        if len(increments) == 0:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        temp_path = self.spool_path + ".tmp"
+        with open(temp_path, "w") as f:
+            for increment in increments:
+                f.write(json_util.dumps(increment) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.spool_path)
+
+def write_increments(collection, increments):
+    # applies each increment at most once, returns the ones that have to be retried. a bucket
+    # records the ids of the increments applied to it, so one that already was matches no
+    # document, its upsert hits the unique index and the duplicate key error means done
+    operations = [UpdateOne(
+        {"sessionId": increment["sessionId"], "bucket": increment["bucket"], "vehicleType": increment["vehicleType"],
+            "direction": increment["direction"], "appliedOps": {"$ne": increment["opId"]}},
+        {"$inc": {"count": increment["count"]}, "$addToSet": {"appliedOps": increment["opId"]},
+            "$setOnInsert": {"deviceId": increment["deviceId"]}},
+        upsert=True) for increment in increments]
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # without the write concern nothing is known, retrying is safe either way
+        if e.details.get("writeConcernErrors"):
+            return increments
+        failed = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY_ERROR}
+        return [increment for (i, increment) in enumerate(increments) if i in failed]
+    except PyMongoError:
+        return increments
+    return []
+
+def create_rollup_indexes(collection) -> None:
+    # the upsert filter, and time range queries per device
+    collection.create_index([("sessionId", ASCENDING), ("bucket", ASCENDING),
+        ("vehicleType", ASCENDING), ("direction", ASCENDING)], unique=True)
+    collection.create_index([("deviceId", ASCENDING), ("bucket", ASCENDING)])
+
+def session_totals(collection, session_id):
+    # totals per direction for one session, summed over its buckets
+    results = collection.aggregate([
+        {"$match": {"sessionId": session_id}},
+        {"$group": {"_id": "$direction", "count": {"$sum": "$count"}}}
+    ])
+    return {result["_id"]: result["count"] for result in results}
+
+def device_counts(collection, device_id, start, end):
+    # counts per bucket for one device across every session, for time series queries
+    results = collection.aggregate([
+        {"$match": {"deviceId": device_id, "bucket": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": {"bucket": "$bucket", "vehicleType": "$vehicleType", "direction": "$direction"},
+            "count": {"$sum": "$count"}}},
+        {"$sort": {"_id.bucket": 1}}
+    ])
+    return [dict(result["_id"], count=result["count"]) for result in results]
@@ -0,0 +1,45 @@
+class FixedScheduler():
+    # the original schedule, detect every skip_frames frames
+    def __init__(self, skip_frames: int = 10):
+        self.skip_frames = skip_frames
+
+    def should_detect(self, frame_index, confidences, active_tracks):
+        return frame_index % self.skip_frames == 0
+
+    def detected(self, frame_index) -> None:
+        pass
+
+class AdaptiveScheduler():
+    # detects sooner when trackers lose confidence or the scene is busy, and backs off
+    # towards max_interval while the road is empty
+    def __init__(self, min_interval: int = 2, max_interval: int = 30, confidence_threshold: float = 7.0, busy_tracks: int = 8):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # dlib peak to side lobe ratios under this mean the tracker is drifting
+        self.confidence_threshold = confidence_threshold
+        # number of active tracks at which the interval is halved
+        self.busy_tracks = busy_tracks
+        self.last_detection = None
+
+    def interval(self, active_tracks):
+        interval = int(self.max_interval / (1 + active_tracks / self.busy_tracks))
+        return max(self.min_interval, interval)
+
+    def should_detect(self, frame_index, confidences, active_tracks):
+        if self.last_detection is None:
+            return True
+
+        frames_since = frame_index - self.last_detection
+        if frames_since < self.min_interval:
+            return False
+        if frames_since >= self.max_interval:
+            return True
+        # nothing to lose track of, wait for the longest interval
+        if active_tracks == 0:
+            return False
+        if len(confidences) > 0 and min(confidences) < self.confidence_threshold:
+            return True
+        return frames_since >= self.interval(active_tracks)
+
+    def detected(self, frame_index) -> None:
+        self.last_detection = frame_index
@@ -0,0 +1,105 @@
+import argparse
+import copy
+import json
+import math
+import multiprocessing
+import time
+import cv2
+import numpy as np
+from scipy.spatial import distance as dist
+from vehicle_tracker import VehicleTracker, TrackingSettings
+
+def plan_shards(total_frames, shards):
+    size = math.ceil(total_frames / shards)
+    return [(start, min(start + size, total_frames)) for start in range(0, total_frames, size)]
+
+def process_shard(arguments):
+    # runs in a worker process, tracks warmup frames before the shard so vehicles already
+    # on the road at its start have state, and records positions at the shard edges
+    (settings, start, end, warmup) = arguments
+    settings = copy.copy(settings)
+    settings.verbose = False
+    settings.testing = False
+    settings.sink = "memory"
+    settings.metrics_port = None
+    settings.start_frame = max(0, start - warmup)
+    settings.end_frame = end
+
+    tracker = VehicleTracker(settings)
+    tracker.snapshot_frames = {start - 1, end - 1}
+    _, _, elapsed_time, _ = tracker.track()
+    return {"start": start, "end": end, "crossings": tracker.logger.crossings,
+        "startSnapshot": tracker.snapshots.get(start - 1, {}), "endSnapshot": tracker.snapshots.get(end - 1, {}),
+        "elapsed": elapsed_time}
+
+def match_vehicles(previous, following, max_distance):
+    # pair vehicles of two shards by their position on the same boundary frame
+    if len(previous) == 0 or len(following) == 0:
+        return {}
+    previous_ids = list(previous.keys())
+    following_ids = list(following.keys())
+    D = dist.cdist(np.array([previous[i][0] for i in previous_ids]), np.array([following[i][0] for i in following_ids]))
+
+    matches = {}
+    for (row, col) in zip(*np.unravel_index(np.argsort(D, axis=None), D.shape)):
+        if D[row, col] > max_distance:
+            break
+        if previous_ids[row] in matches.values() or following_ids[col] in matches:
+            continue
+        matches[following_ids[col]] = previous_ids[row]
+    return matches
+
+def stitch_shards(results, max_distance: float = 50):
+    # crossings from the first shard are kept as they are. for every later shard, vehicles
+    # are matched to the previous shard on the boundary frame: a match the previous shard
+    # already counted is not counted again, and a match counted during warmup that the
+    # previous shard had not counted yet is kept, since neither shard counts it otherwise
+    crossings = [crossing[:3] for crossing in results[0]["crossings"]]
+    for (previous, shard) in zip(results, results[1:]):
+        matches = match_vehicles(previous["endSnapshot"], shard["startSnapshot"], max_distance)
+        previous_counted = {vehicle_id for (vehicle_id, (_, counted)) in previous["endSnapshot"].items() if counted}
+        for (frame, class_name, direction, vehicle_id) in shard["crossings"]:
+            matched = matches.get(vehicle_id)
+            if frame >= shard["start"]:
+                if matched is not None and matched in previous_counted:
+                    continue
+            elif matched is None or matched in previous_counted:
+                continue
+            crossings.append((frame, class_name, direction))
+    return sorted(crossings)
+
+def track_sharded(settings: TrackingSettings, shards: int = multiprocessing.cpu_count(), workers: int = None,
+                        warmup: int = 150, max_distance: float = 50):
+    video_stream = cv2.VideoCapture(settings.video_input)
+    total_frames = int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT))
+    video_stream.release()
+    if total_frames <= 0:
+        raise ValueError("Sharding needs a recorded video with a known frame count, {} has none".format(settings.video_input))
+
+    start = time.perf_counter()
+    plan = plan_shards(total_frames, shards)
+    with multiprocessing.Pool(workers or len(plan)) as pool:
+        results = pool.map(process_shard, [(settings, shard_start, shard_end, warmup) for (shard_start, shard_end) in plan])
+    elapsed = time.perf_counter() - start
+
+    crossings = stitch_shards(results, max_distance)
+    totals = {}
+    for (_, class_name, direction) in crossings:
+        totals.setdefault(direction, {})
+        totals[direction][class_name] = totals[direction].get(class_name, 0) + 1
+    return {"frames": total_frames, "shards": len(plan), "elapsedSeconds": elapsed,
+        "shardSeconds": sum(result["elapsed"] for result in results), "totals": totals, "crossings": crossings}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Track a recorded video in parallel frame range shards')
+    parser.add_argument('--input', type=str, default="../data/test-clip.mp4", help='The recorded video to process')
+    parser.add_argument('--roi', type=int, default=90, help='Region of Interest Value (Y Cut Off)')
+    parser.add_argument('--skip', type=int, default=15, help='Number of skip frames')
+    parser.add_argument('--maxw', type=int, default=800, help='Max Width Value used to resize input frame')
+    parser.add_argument('--shards', type=int, default=multiprocessing.cpu_count(), help='Number of frame range shards')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to one per shard')
+    parser.add_argument('--warmup', type=int, default=150, help='Frames tracked before each shard to pick up vehicles already in view')
+    args = parser.parse_args()
+
+    settings = TrackingSettings(video_input=args.input, y_roi=args.roi, skip_frames=args.skip, max_width=args.maxw)
+    print(json.dumps(track_sharded(settings, args.shards, args.workers, args.warmup), indent=2, default=str))
@@ -0,0 +1,114 @@
+import datetime
+import json
+import sqlite3
+import uuid
+from device import iot_device
+
+SINK_TYPES = ["mongo", "sqlite", "jsonl", "null", "memory"]
+DEFAULT_PATHS = {"sqlite": "../data/vehicles.sqlite", "jsonl": "../data/vehicles.jsonl"}
+
+class EventSink():
+    # where counted vehicles go, VehicleTracker only talks to this interface
+    def __init__(self, verbose):
+        self.verbose = verbose
+        self.session_id = None
+        self.totals = {}
+
+    def insert_vehicle(self, vehicle) -> None:
+        self.totals[vehicle.direction] = self.totals.get(vehicle.direction, 0) + 1
+
+    def close(self) -> None:
+        if self.verbose == True:
+            print("Session #", self.session_id, " UP: ", self.totals.get("up", 0), " DOWN: ", self.totals.get("down", 0),
+                " Ended: ", datetime.datetime.now(datetime.timezone.utc))
+
+class NullSink(EventSink):
+    # counts only, for benchmarks and runs that should not persist anything
+    pass
+
+class MemorySink(EventSink):
+    # keeps every crossing in memory, for benchmarks that score counts afterwards
+    def __init__(self, verbose):
+        super().__init__(verbose)
+        self.crossings = []
+
+    def insert_vehicle(self, vehicle) -> None:
+        super().insert_vehicle(vehicle)
+        self.crossings.append((vehicle.counted_frame, vehicle.class_name, vehicle.direction, vehicle.object_id))
+
+class JsonlSink(EventSink):
+    def __init__(self, verbose, path: str = DEFAULT_PATHS["jsonl"]):
+        super().__init__(verbose)
+        self.device = iot_device()
+        self.session_id = uuid.uuid4().hex
+        self.file = open(path, "a")
+        self.__write({"event": "sessionStarted", "deviceId": str(self.device.mac_address), "deviceName": self.device.name,
+            "location": self.device.location, "time": datetime.datetime.now(datetime.timezone.utc)})
+
+    def __write(self, event) -> None:
+        event["sessionId"] = self.session_id
+        self.file.write(json.dumps(event, default=str) + "\n")
+        self.file.flush()
+
+    def insert_vehicle(self, vehicle) -> None:
+        super().insert_vehicle(vehicle)
+        self.__write({"event": "vehicle", "vehicleType": vehicle.class_name, "direction": vehicle.direction,
+            "timeCrossed": vehicle.counted})
+
+    def close(self) -> None:
+        self.__write({"event": "sessionEnded", "time": datetime.datetime.now(datetime.timezone.utc)})
+        self.file.close()
+        super().close()
+
+class SQLiteSink(EventSink):
+    # commits in batches, a commit per vehicle would fsync on the frame loop
+    def __init__(self, verbose, path: str = DEFAULT_PATHS["sqlite"], commit_every: int = 50):
+        super().__init__(verbose)
+        self.device = iot_device()
+        self.device_id = str(self.device.mac_address)
+        self.commit_every = commit_every
+        self.pending = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS devices (id TEXT PRIMARY KEY, name TEXT, location TEXT, last_updated TEXT);
+            CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY, device_id TEXT, time_started TEXT, time_ended TEXT);
+            CREATE TABLE IF NOT EXISTS vehicles (session_id INTEGER, vehicle_type TEXT, direction TEXT, time_crossed TEXT);
+            CREATE INDEX IF NOT EXISTS vehicles_session ON vehicles (session_id, direction);
+        """)
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.connection.execute("INSERT OR IGNORE INTO devices VALUES (?, ?, ?, ?)",
+            (self.device_id, self.device.name, self.device.location, now))
+        self.session_id = self.connection.execute("INSERT INTO sessions (device_id, time_started) VALUES (?, ?)",
+            (self.device_id, now)).lastrowid
+        self.connection.commit()
+
+    def insert_vehicle(self, vehicle) -> None:
+        super().insert_vehicle(vehicle)
+        self.connection.execute("INSERT INTO vehicles VALUES (?, ?, ?, ?)",
+            (self.session_id, vehicle.class_name, vehicle.direction, vehicle.counted.isoformat()))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        self.connection.execute("UPDATE sessions SET time_ended = ? WHERE id = ?",
+            (datetime.datetime.now(datetime.timezone.utc).isoformat(), self.session_id))
+        self.connection.commit()
+        self.connection.close()
+        super().close()
+
+def create_sink(sink_type: str = "mongo", verbose: bool = True, path: str = None) -> EventSink:
+    if sink_type == "mongo":
+        # pymongo is only imported when the database is actually used
+        from api import api_connection
+        return api_connection(verbose)
+    if sink_type == "sqlite":
+        return SQLiteSink(verbose, path or DEFAULT_PATHS["sqlite"])
+    if sink_type == "jsonl":
+        return JsonlSink(verbose, path or DEFAULT_PATHS["jsonl"])
+    if sink_type == "null":
+        return NullSink(verbose)
+    if sink_type == "memory":
+        return MemorySink(verbose)
+    raise ValueError("Unknown sink {}, expected one of {}".format(sink_type, ", ".join(SINK_TYPES)))
@@ -0,0 +1,156 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import random
+from vehicle_tracker import VehicleTracker, TrackingSettings
+from benchmark import run_benchmark, resolve_ground_truth
+
+# values tried for every setting when no search space file is given
+DEFAULT_SPACE = {
+    "y_roi": [60, 90, 120],
+    "skip_frames": [5, 10, 15, 20],
+    "max_width": [500, 650, 800],
+    "max_disappeared": [10, 15, 25]
+}
+SWEEP_MODES = ["grid", "random"]
+METRIC_FIELDS = ["fps", "precision", "recall", "f1", "crossings", "detections", "error"]
+RESULT_FIELDS = ["y_roi", "skip_frames", "max_width", "max_disappeared"] + METRIC_FIELDS
+# frames tracked untimed before the throughput pass, so the first timed run does not pay for a cold disk cache
+WARMUP_FRAMES = 30
+
+def grid_configurations(space):
+    names = sorted(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+def random_configurations(space, samples, seed=None):
+    # a setting is either a list of values or a {"min", "max"} integer range
+    generator = random.Random(seed)
+    configurations = []
+    for _ in range(samples):
+        configuration = {}
+        for (name, values) in sorted(space.items()):
+            if isinstance(values, dict):
+                configuration[name] = generator.randint(values["min"], values["max"])
+            else:
+                configuration[name] = generator.choice(values)
+        configurations.append(configuration)
+    return configurations
+
+def run_configuration(arguments):
+    # runs in a worker process, a failing configuration is recorded instead of ending the sweep.
+    # only the accuracy is kept, the speed of a run sharing the cpu or replaying cached
+    # detections says nothing about the hardware
+    (video_input, ground_truth, tolerance_seconds, detection_cache, configuration) = arguments
+    result = dict(configuration)
+    try:
+        settings = TrackingSettings(video_input=video_input, detection_cache=detection_cache, **configuration)
+        report = run_benchmark(settings, ground_truth, tolerance_seconds)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    overall = report["accuracy"]["overall"]
+    result.update({"precision": overall["precision"], "recall": overall["recall"], "f1": overall["f1"],
+        "crossings": report["crossings"], "detections": report["detections"]})
+    return result
+
+def configuration_of(result):
+    return {name: value for (name, value) in result.items() if name not in METRIC_FIELDS}
+
+def measure_throughput(video_input, configuration, frames: int = None):
+    # frames per second of a full run, detector included, over the first frames of the input
+    settings = TrackingSettings(video_input=video_input, verbose=False, sink="null", end_frame=frames, **configuration)
+    _, _, _, average_fps = VehicleTracker(settings).track()
+    return average_fps
+
+def pareto_front(results):
+    # configurations no other configuration beats on both fps and f1, fastest first
+    front = []
+    best_f1 = None
+    for result in sorted(results, key=lambda r: (-r["fps"], -r["f1"])):
+        if best_f1 is None or result["f1"] > best_f1:
+            front.append(result)
+            best_f1 = result["f1"]
+    return front
+
+def sweep(video_input, ground_truth, configurations, workers: int = None, tolerance_seconds: float = 1.0,
+                detection_cache: bool = True, throughput_frames: int = None, verbose: bool = True):
+    # accuracy is measured in parallel, then throughput one configuration at a time without
+    # the cache, so every fps on the front was measured the same way on an idle machine.
+    # with the cache on, one configuration per cached detection setup runs first, so the
+    # configurations that only change tracker settings replay its detections
+    phases = [configurations]
+    if detection_cache == True:
+        first = {}
+        for configuration in configurations:
+            first.setdefault((configuration.get("y_roi"), configuration.get("max_width")), configuration)
+        phases = [list(first.values()), [c for c in configurations if all(c is not f for f in first.values())]]
+
+    results = []
+    with multiprocessing.Pool(workers or multiprocessing.cpu_count()) as pool:
+        for phase in phases:
+            arguments = [(video_input, ground_truth, tolerance_seconds, detection_cache, configuration) for configuration in phase]
+            for result in pool.imap_unordered(run_configuration, arguments):
+                results.append(result)
+                if verbose == True:
+                    print("[{}/{}] {}".format(len(results), len(configurations), json.dumps(result)))
+
+    completed = [result for result in results if "error" not in result]
+    if len(completed) > 0:
+        measure_throughput(video_input, configuration_of(completed[0]), WARMUP_FRAMES)
+    for (i, result) in enumerate(completed):
+        try:
+            result["fps"] = measure_throughput(video_input, configuration_of(result), throughput_frames)
+        except Exception as e:
+            result["error"] = str(e)
+        if verbose == True:
+            print("[throughput {}/{}] {}".format(i + 1, len(completed), json.dumps(result)))
+
+    return results, pareto_front([result for result in completed if "error" not in result])
+
+def write_csv(path, results) -> None:
+    with open(path, mode='w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweep tracking settings over a reference clip for the best accuracy and FPS trade offs')
+    parser.add_argument('--input', type=str, default="../data/test-clip.mp4", help='The reference video every configuration runs on')
+    parser.add_argument('--truth', type=str, default=None, help='Ground truth crossings csv with frame,class,direction columns, the test clip is scored by its class counts without one')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Seconds a detected crossing may be from the true crossing')
+    parser.add_argument('--space', type=str, default=None, help='JSON file mapping y_roi, skip_frames, max_width and max_disappeared to lists of values, or {"min", "max"} ranges in random mode')
+    parser.add_argument('--mode', type=str, default="grid", choices=SWEEP_MODES, help='Try every combination or a random sample of them')
+    parser.add_argument('--samples', type=int, default=20, help='Number of configurations tried in random mode')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for random mode')
+    parser.add_argument('--workers', type=int, default=None, help='Configurations run at once, defaults to one per CPU')
+    parser.add_argument('--no-cache', action='store_true', help='Detect on every accuracy run instead of replaying the detection cache')
+    parser.add_argument('--throughput-frames', type=int, default=None, help='Frames timed per configuration in the throughput pass, defaults to the whole input')
+    parser.add_argument('--output', type=str, default="sweep", help='Prefix of the .csv, -pareto.csv and .json result files')
+    args = parser.parse_args()
+    try:
+        ground_truth = resolve_ground_truth(args.input, args.truth)
+    except ValueError as e:
+        parser.error(str(e))
+
+    space = DEFAULT_SPACE
+    if args.space is not None:
+        with open(args.space, "r") as f:
+            space = json.load(f)
+    if args.mode == "grid":
+        configurations = grid_configurations(space)
+    else:
+        configurations = random_configurations(space, args.samples, args.seed)
+
+    results, front = sweep(args.input, ground_truth, configurations, args.workers,
+        args.tolerance, not args.no_cache, args.throughput_frames)
+    write_csv(args.output + ".csv", results)
+    write_csv(args.output + "-pareto.csv", front)
+    with open(args.output + ".json", "w") as f:
+        json.dump({"input": args.input, "space": space, "mode": args.mode, "results": results, "pareto": front}, f, indent=2)
+
+    print("Pareto front, fps against f1:")
+    for result in front:
+        print(json.dumps(result))
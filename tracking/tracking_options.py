@@ -0,0 +1,7 @@
+# choices of the tracking settings, kept free of imports so main.py can check its
+# arguments before opencv and numpy are loaded
+
+# how detections are matched to tracked vehicles
+ASSIGNMENT_TYPES = ["greedy", "optimal"]
+# how vehicles are followed between detections, dlib correlation trackers or a kalman filter
+TRACKING_BACKENDS = ["correlation", "kalman"]
@@ -1,16 +1,30 @@
+from collections import deque
+
+# recent centroids kept per vehicle
+CENTROID_HISTORY = 32
+
 class TrackableVehicle():
-    def __init__(self, id, label, centroid):
+    __slots__ = ("object_id", "centroids", "class_name", "direction", "counted", "counted_frame", "correct")
+
+    def __init__(self, id, label, centroid, history: int = CENTROID_HISTORY):
         self.object_id = id
-        self.centroids = [centroid]
+        self.centroids = deque([centroid], maxlen=history)
         self.class_name = label
         self.direction = None
         self.counted = False
+        # index of the frame the vehicle was counted on
+        self.counted_frame = None
         self.correct = None
 
+    def add_centroid(self, centroid) -> None:
+        self.centroids.append(centroid)
+
     def __repr__(self):
         return "ID: {}, Class: {} Direction: {}, Time Counted: {}".format(self.object_id, self.class_name, self.direction, self.counted)
 
 class LabelledTracker():
+    __slots__ = ("vehicle_class", "crl_tracker")
+
     def __init__(self, label, tracker):
         self.vehicle_class = label
-        self.crl_tracker = tracker
\ No newline at end of file
+        self.crl_tracker = tracker
@@ -1,18 +1,39 @@
 import datetime
+import importlib
+import os
+import time
 import numpy as np
 import imutils
-import dlib
 import cv2
 import csv
-from api import api_connection
+from concurrent.futures import ThreadPoolExecutor
+from sinks import create_sink
 from centroid_tracker import CentroidTracker
 from vehicle import TrackableVehicle, LabelledTracker
 from classifier import yolov4, CONFIDENCE_THRESHOLD, NMS_THRESHOLD
 from fps import FPS
+from metrics import StageMetrics, NullStageTimer
+from pipeline import FramePipeline
+from scheduler import FixedScheduler, AdaptiveScheduler
+from motion import MotionDetector, bounding_region
+from detection_cache import DetectionCache, CACHE_DIRECTORY
+from gates import GateCounter, midline_gate
+from output import AnnotationRenderer, WindowOutput, RecordingOutput, MjpegOutput
+from live import LatestFrameReader, SimulatedCamera
+from kalman_tracker import KalmanTracker
 
 class TrackingSettings():
     def __init__(self, video_input="../data/test-clip.mp4", max_disappeared: int = 15, skip_frames: int = 10,
-                             y_roi: int = 0, max_width: int = 500, verbose: bool = True, testing: bool = False):
+                             y_roi: int = 0, max_width: int = 500, verbose: bool = True, testing: bool = False,
+                             pipelined: bool = False, queue_size: int = 8, sink: str = "mongo", sink_path: str = None,
+                             max_distance: float = None, assignment: str = "greedy",
+                             tracking_workers: int = 0, adaptive: bool = False, min_skip: int = 2, max_skip: int = 30,
+                             motion_gating: bool = False, instrumentation: bool = False, metrics_interval: float = 10.0,
+                             metrics_port: int = None, start_frame: int = 0, end_frame: int = None,
+                             detection_cache: bool = False, cache_path: str = CACHE_DIRECTORY, cache_size_mb: float = 512,
+                             gates=None, display: bool = None, record_path: str = None, preview_port: int = None,
+                             live: bool = False, simulate_live: bool = False, reconnect_delay: float = 1.0, max_reconnects: int = None,
+                             tracking_backend: str = "correlation", refine_tracks: bool = True):
 
         self.video_input = video_input
         self.max_disappeared = max_disappeared
@@ -21,6 +42,52 @@ class TrackingSettings():
         self.max_width = max_width
         self.verbose = verbose
         self.testing = testing
+        # run decode, preprocessing, tracking and output as separate pipeline stages
+        self.pipelined = pipelined
+        self.queue_size = queue_size
+        # where counted vehicles are logged, mongo, sqlite, jsonl or null
+        self.sink = sink
+        self.sink_path = sink_path
+        # centroid matching, greedy or optimal, optionally gated by a maximum distance in pixels
+        self.max_distance = max_distance
+        self.assignment = assignment
+        # worker processes for the correlation trackers, 0 updates them serially
+        self.tracking_workers = tracking_workers
+        # detect when tracking degrades instead of every skip_frames, within min/max_skip frames
+        self.adaptive = adaptive
+        self.min_skip = min_skip
+        self.max_skip = max_skip
+        # skip detection on static frames and only detect inside regions that moved
+        self.motion_gating = motion_gating
+        # per stage latency percentiles, logged every metrics_interval seconds and served
+        # on http://127.0.0.1:metrics_port/metrics when a port is given
+        self.instrumentation = instrumentation
+        self.metrics_interval = metrics_interval
+        self.metrics_port = metrics_port
+        # only track frames [start_frame, end_frame) of a recorded video
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        # replay detections of a recorded video from disk, kept under cache_size_mb in cache_path
+        self.detection_cache = detection_cache
+        self.cache_path = cache_path
+        self.cache_size_mb = cache_size_mb
+        # lines and polygons vehicles are counted crossing, None counts on the horizontal midline
+        self.gates = gates
+        # annotated output, drawn on its own thread: the local window, None shows it when verbose,
+        # a recording and an mjpeg preview on http://127.0.0.1:preview_port/
+        self.display = display
+        self.record_path = record_path
+        self.preview_port = preview_port
+        # camera mode, always track the newest frame and reconnect a lost stream with backoff.
+        # simulate_live plays a recorded input back in real time to stand in for a camera
+        self.live = live
+        self.simulate_live = simulate_live
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnects = max_reconnects
+        # correlation or kalman, the kalman filter needs no image work between detections
+        # except template matching the tracks it is unsure of, unless refine_tracks is off
+        self.tracking_backend = tracking_backend
+        self.refine_tracks = refine_tracks
         # allowing just person, bicycle, car, motorcycle, bus 5 and truck
         self.trackable_classes = [0, 1, 2, 3, 7]
     
@@ -36,87 +103,305 @@ class TrackingSettings():
             'skip_frames': self.skip_frames, 'y_roi': self.y_roi, 'max_width': self.max_width, 'verbose': self.verbose})
         
 class VehicleTracker():
-    def __init__(self, settings: TrackingSettings = None):
+    def __init__(self, settings: TrackingSettings = None, inference_server=None):
         if settings is None:
             self.settings = TrackingSettings()
         else:
             self.settings = settings
 
-        self.logger = api_connection(self.settings.verbose)
-        self.video_stream = cv2.VideoCapture(self.settings.video_input)
-        self.centroid_tracker = CentroidTracker(max_disappeared=self.settings.max_disappeared)
-        self.classifier = yolov4()
-        self.total_frames_processed = 0
+        # seconds spent on each part of startup, first_frame is from here to the first tracked frame
+        self.startup_times = {}
+        self.startup_start = time.perf_counter()
+        # loading the model, opening the stream and connecting the sink mostly wait on disk,
+        # the gpu or the network, so they run at the same time. the sink is connected on this
+        # thread, the one that logs to it, as sqlite connections can not change threads
+        self.inference_server = inference_server
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            video_stream = executor.submit(self.__timed, "stream", self.__open_stream)
+            # dlib is only needed once the first detection starts trackers
+            if self.settings.tracking_backend == "correlation" and self.settings.tracking_workers == 0:
+                executor.submit(self.__timed, "dlib", importlib.import_module, "dlib")
+            # trackers sharing an inference server use its network instead of loading their own
+            if self.inference_server is None:
+                classifier = executor.submit(self.__load_classifier)
+            self.logger = self.__timed("sink", create_sink, self.settings.sink, self.settings.verbose, self.settings.sink_path)
+            self.centroid_tracker = CentroidTracker(max_disappeared=self.settings.max_disappeared,
+                max_distance=self.settings.max_distance, assignment=self.settings.assignment)
+            self.video_stream = video_stream.result()
+            if self.inference_server is None:
+                self.classifier = classifier.result()
+                self.detect = self.classifier.detect
+            else:
+                self.classifier = self.inference_server.classifier
+                self.detect = self.inference_server.detect
+        # frame indices count from the start frame so the detection schedule lines up with a full run
+        self.total_frames_processed = self.settings.start_frame
+        self.frames_read = self.settings.start_frame
         self.video_width = None
         self.video_height = None
         self.crl_trackers = []
+        self.parallel_tracker = None
+        self.kalman_tracker = None
+        if self.settings.tracking_backend == "kalman":
+            self.kalman_tracker = KalmanTracker(refine=self.settings.refine_tracks)
+        elif self.settings.tracking_workers > 0:
+            from parallel_tracking import ParallelCorrelationTracker
+            self.parallel_tracker = ParallelCorrelationTracker(self.settings.tracking_workers)
+        # peak to side lobe ratio of every tracker on the last tracking frame
+        self.tracker_confidences = []
+        if self.settings.adaptive == True:
+            self.scheduler = AdaptiveScheduler(self.settings.min_skip, self.settings.max_skip)
+        else:
+            self.scheduler = FixedScheduler(self.settings.skip_frames)
+        self.total_detections = 0
+        # capture to count latency of every counted vehicle in live mode
+        self.live = self.settings.live == True or self.settings.simulate_live == True
+        self.latency_count = 0
+        self.latency_total = 0
+        self.latency_max = 0
+        self.detector_calls = 0
+        # time spent in each stage of the frame loop, a no op unless instrumentation is on
+        if self.settings.instrumentation == True:
+            self.stage_timer = StageMetrics(emit_interval=self.settings.metrics_interval, port=self.settings.metrics_port)
+        else:
+            self.stage_timer = NullStageTimer()
+        self.motion_detector = MotionDetector() if self.settings.motion_gating == True else None
+        # only recorded files can be cached, a live stream never shows the same frame twice
+        self.detection_cache = None
+        if self.settings.detection_cache == True and os.path.isfile(str(self.settings.video_input)):
+            self.detection_cache = DetectionCache(self.settings.video_input, self.settings, self.classifier.config,
+                CONFIDENCE_THRESHOLD, NMS_THRESHOLD, self.settings.cache_path, self.settings.cache_size_mb)
+        # built on the first frame, the default midline depends on the frame size
+        self.gate_counter = None
+        self.renderer = None
         self.tracked_vehicles = {}
+        # vehicles the centroid tracker dropped, only kept when testing needs every result
+        self.finished_vehicles = {}
+        # frame indices to record the tracked vehicle positions after, used to stitch shards
+        self.snapshot_frames = set()
+        self.snapshots = {}
+        self.startup_times["total"] = time.perf_counter() - self.startup_start
+
+    def __timed(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.startup_times[name] = time.perf_counter() - start
+        return result
+
+    def __open_stream(self):
+        if self.settings.live == True or self.settings.simulate_live == True:
+            if self.settings.simulate_live == True:
+                open_capture = lambda: SimulatedCamera(self.settings.video_input)
+            else:
+                open_capture = lambda: cv2.VideoCapture(self.settings.video_input)
+            reader = LatestFrameReader(open_capture, self.settings.reconnect_delay,
+                max_reconnects=self.settings.max_reconnects, verbose=self.settings.verbose)
+            reader.start()
+            return reader
+
+        video_stream = cv2.VideoCapture(self.settings.video_input)
+        if self.settings.start_frame > 0:
+            video_stream.set(cv2.CAP_PROP_POS_FRAMES, self.settings.start_frame)
+        return video_stream
+
+    def __load_classifier(self):
+        classifier = self.__timed("model", yolov4)
+        # the first forward pass allocates buffers and initialises the backend, pay for it
+        # here instead of on the first detection frame
+        (width, height) = classifier.input_size
+        self.__timed("warmup", classifier.detect, np.zeros((height, width, 3), dtype=np.uint8),
+            CONFIDENCE_THRESHOLD, NMS_THRESHOLD, self.settings.trackable_classes)
+        return classifier
 
     def track(self):
         self.fps = FPS().start()
+        try:
+            # the reader thread already decodes ahead, queueing frames would only add latency
+            if self.settings.pipelined == True and self.live == False:
+                self.__track_pipelined()
+            else:
+                self.__track_serial()
+        except BaseException:
+            # a failed or interrupted run still closes the sink, so the vehicles its writer
+            # buffered are written or spooled, then the loop's own error is raised
+            self.fps.stop()
+            self.__release()
+            raise
+
+        # stop fps, then release everything before an output error is raised
+        self.fps.stop()
+        error = self.__release()
+        if error is not None:
+            raise error
+
+        if self.settings.verbose == True:
+            if self.live == True:
+                print("Live: {} frames captured, {} dropped, {} reconnects".format(self.video_stream.frames_captured,
+                    self.video_stream.dropped, self.video_stream.reconnects))
+                if self.latency_count > 0:
+                    print("Capture To Count Latency: mean {:.1f}ms, max {:.1f}ms".format(
+                        self.latency_total / self.latency_count * 1000, self.latency_max * 1000))
+            if self.renderer is not None:
+                print("Output: {} frames rendered, {} dropped".format(self.renderer.rendered, self.renderer.dropped))
+            if self.detection_cache is not None:
+                print("Detection Cache: {} hits, {} misses".format(self.detection_cache.hits, self.detection_cache.misses))
+            if self.settings.gates is not None and self.gate_counter is not None:
+                for (gate_name, totals) in self.gate_counter.totals.items():
+                    print("Gate {}: {}".format(gate_name, ", ".join("{} {}".format(direction, count) for (direction, count) in totals.items())))
+            if self.parallel_tracker is not None:
+                print("Parallel Tracking Speedup: {:.2f}x over {} workers".format(self.parallel_tracker.speedup(), self.settings.tracking_workers))
+
+        # return session id for testing and fps information
+        tracked_vehicles = {**self.finished_vehicles, **self.tracked_vehicles}
+        return self.logger.session_id, tracked_vehicles, self.fps.elapsed(), self.fps.fps()
+
+    def __release(self):
+        # every resource is released even when one of them fails, so the sink is closed and
+        # the detection cache written whatever the renderer did. returns the first error
+        releases = [self.video_stream.release]
+        if self.renderer is not None:
+            releases.append(self.renderer.stop)
+        releases.extend([self.logger.close, self.stage_timer.close])
+        if self.detection_cache is not None:
+            releases.append(self.detection_cache.close)
+        if self.parallel_tracker is not None:
+            releases.append(self.parallel_tracker.close)
+
+        first_error = None
+        for release in releases:
+            try:
+                release()
+            except Exception as e:
+                if first_error is None:
+                    first_error = e
+        return first_error
+
+    def __track_serial(self):
         while True:
-            frame = self.video_stream.read()
-            frame = frame[1] if self.settings.video_input else frame
+            frame = self.__read_frame()
             # check if frame is empty
             if frame is None:
                 break
 
             frame, rgb_frame = self.__process_frame(frame)
+            self.__track_frame(frame, rgb_frame)
 
-            bounding_boxes = [] # box rectangles from YOLO or tracker
-            # DETECTION STAGE (YOLOv4)
-            if self.total_frames_processed % self.settings.skip_frames == 0:
-                self.__detect_vehicles(frame, rgb_frame)
-            # TRACKING STAGE (dlib)
-            else:
-                self.__update_tracked_rectangles(rgb_frame, bounding_boxes)
-
-            # use the centroid tracker to associate the old centroids with new object centroids
-            vehicles, class_ids = self.centroid_tracker.update(bounding_boxes)
-            self.__check_centroids(vehicles, class_ids, frame)
-          
-            # display frame if verbose
-            if(self.settings.verbose == True):
-                waitkey_pressed = self.__display_frame(frame)
-                if waitkey_pressed == True:
-                    break
+            # hand the frame to the display, recording and preview
+            if self.__output_frame(frame) == True:
+                break
 
             # increment the total number of frames processed
             self.total_frames_processed += 1
             self.fps.update()
+            self.stage_timer.tick()
 
-        # stop fps, release video and cv2 windows
-        self.fps.stop()
-        self.video_stream.release()
-        cv2.destroyAllWindows()
-        self.logger.close()
+    def __track_pipelined(self):
+        # decode and preprocessing run ahead on their own threads, output runs behind on the renderer
+        pipeline = FramePipeline(self.__read_frame, self.__process_frame, self.settings.queue_size)
+        pipeline.start()
+        try:
+            for (frame, rgb_frame) in pipeline:
+                self.__track_frame(frame, rgb_frame)
+                if self.__output_frame(frame) == True:
+                    break
 
-        # return session id for testing and fps information
-        return self.logger.session_id, self.tracked_vehicles, self.fps.elapsed(), self.fps.fps()
+                # increment the total number of frames processed
+                self.total_frames_processed += 1
+                self.fps.update()
+                self.stage_timer.tick()
+        finally:
+            pipeline.stop()
+
+    def __read_frame(self):
+        if self.settings.end_frame is not None and self.frames_read >= self.settings.end_frame:
+            return None
+        self.frames_read += 1
+
+        start = self.stage_timer.start()
+        frame = self.video_stream.read()
+        frame = frame[1] if self.settings.video_input else frame
+        self.stage_timer.lap("decode", start)
+        return frame
+
+    def __track_frame(self, frame, rgb_frame) -> None:
+        bounding_boxes = [] # box rectangles from YOLO or tracker
+        if self.gate_counter is None:
+            self.gate_counter = GateCounter(self.settings.gates or [midline_gate(self.video_width, self.video_height)])
+            self.renderer = self.__start_renderer()
+        start = self.stage_timer.start()
+        # every frame feeds the motion detector, so motion between detections is not missed
+        if self.motion_detector is not None:
+            self.motion_detector.apply(frame[self.settings.y_roi: self.video_height])
+
+        # DETECTION STAGE (YOLOv4)
+        if self.scheduler.should_detect(self.total_frames_processed, self.tracker_confidences, len(self.centroid_tracker.ids)):
+            self.__detect_vehicles(frame, rgb_frame)
+            self.scheduler.detected(self.total_frames_processed)
+            self.total_detections += 1
+            start = self.stage_timer.lap("detect", start)
+        # TRACKING STAGE (dlib)
+        else:
+            self.__update_tracked_rectangles(frame, rgb_frame, bounding_boxes)
+            start = self.stage_timer.lap("track", start)
+
+        # use the centroid tracker to associate the old centroids with new object centroids
+        vehicles, class_ids = self.centroid_tracker.update(bounding_boxes)
+        self.__evict_vehicles()
+        start = self.stage_timer.lap("associate", start)
+        self.__check_centroids(vehicles, class_ids)
+        self.__count_crossings()
+        self.stage_timer.lap("count", start)
+
+        if "first_frame" not in self.startup_times:
+            self.startup_times["first_frame"] = time.perf_counter() - self.startup_start
+
+        if self.total_frames_processed in self.snapshot_frames:
+            self.snapshots[self.total_frames_processed] = {vehicle_id: (tuple(int(value) for value in vehicle.centroids[-1]), vehicle.counted != False)
+                for (vehicle_id, vehicle) in self.tracked_vehicles.items()}
 
     def __process_frame(self, frame):
+        start = self.stage_timer.start()
         # resize frame
         frame = imutils.resize(frame, width=self.settings.max_width)
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # only the correlation trackers read the rgb copy
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if self.kalman_tracker is None else None
         # set frame width and height
         if self.video_width is None or self.video_height is None:
             (self.video_height, self.video_width) = frame.shape[:2]
 
+        self.stage_timer.lap("preprocess", start)
         return frame, rgb_frame
 
     def __detect_vehicles(self, frame, rgb_frame) -> None:
-        self.crl_trackers = [] # reset trackers
         # set region of interest (cut frame @ y value)
         roi = frame[self.settings.y_roi: self.video_height]
-        classes, scores, boxes = self.classifier.model.detect(roi, CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
-        for (classid, score, box) in zip(classes, scores, boxes):
-            if classid not in self.settings.trackable_classes:
-                continue
-            left = box[0]
-            top = box[1] + self.settings.y_roi
-            right = box[0] + box[2]
-            bottom = box[1] + box[3] + self.settings.y_roi
+        detected = self.__run_detector(roi)
+        # nothing moved since the last detection, keep following the current trackers
+        if detected is None:
+            return
+
+        self.crl_trackers = [] # reset trackers
+        self.tracker_confidences = []
+        # the detector only returns trackable classes, boxes go from (left, top, width, height)
+        # in the roi to (left, top, right, bottom) in the frame for every box at once
+        classes, scores, boxes = detected
+        boxes = np.reshape(boxes, (-1, 4)).astype(int)
+        rects = np.column_stack([boxes[:, 0], boxes[:, 1] + self.settings.y_roi,
+            boxes[:, 0] + boxes[:, 2], boxes[:, 1] + boxes[:, 3] + self.settings.y_roi])
+        detections = list(zip(np.ravel(classes).tolist(), map(tuple, rects.tolist())))
 
+        if self.kalman_tracker is not None:
+            self.kalman_tracker.correct(frame, detections)
+            return
+        # the workers build their share of the trackers from the shared frame
+        if self.parallel_tracker is not None:
+            self.parallel_tracker.start(rgb_frame, detections)
+            return
+
+        # imported on first use, startup already loaded it in the background
+        import dlib
+
+        for (classid, (left, top, right, bottom)) in detections:
             # construct a dlib rectangle and tracker
             tracker = dlib.correlation_tracker()
             rect = dlib.rectangle(left, top, right, bottom) 
@@ -125,11 +410,56 @@ class VehicleTracker():
             # create labelled tracker 
             labelled_tracker = LabelledTracker(classid, tracker)
             self.crl_trackers.append(labelled_tracker)
-        
-    def __update_tracked_rectangles(self, rgb_frame, bounding_boxes) -> None:
+
+    def __run_detector(self, roi):
+        if self.detection_cache is None:
+            return self.__detect_roi(roi)
+
+        detected = self.detection_cache.get(self.total_frames_processed)
+        if detected is False:
+            detected = self.__detect_roi(roi)
+            self.detection_cache.put(self.total_frames_processed, detected)
+        elif self.motion_detector is not None:
+            # start accumulating motion afresh, as a detection would have
+            self.motion_detector.regions()
+        return detected
+
+    def __detect_roi(self, roi):
+        if self.motion_detector is None:
+            self.detector_calls += 1
+            return self.detect(roi, CONFIDENCE_THRESHOLD, NMS_THRESHOLD, self.settings.trackable_classes)
+
+        regions = self.motion_detector.regions()
+        if len(regions) == 0:
+            return None
+        # one pass over the box around every moving region, a pass per region costs more
+        # than the whole roi once the road is busy
+        region = bounding_region(regions)
+        self.detector_calls += 1
+        if self.motion_detector.covers_frame([region]):
+            return self.detect(roi, CONFIDENCE_THRESHOLD, NMS_THRESHOLD, self.settings.trackable_classes)
+
+        # boxes shifted back to roi coordinates
+        (left, top, width, height) = region
+        classes, scores, boxes = self.detect(roi[top:top + height, left:left + width],
+            CONFIDENCE_THRESHOLD, NMS_THRESHOLD, self.settings.trackable_classes)
+        return np.ravel(classes), np.ravel(scores), np.reshape(boxes, (-1, 4)) + [left, top, 0, 0]
+
+    def __update_tracked_rectangles(self, frame, rgb_frame, bounding_boxes) -> None:
+        if self.kalman_tracker is not None:
+            # the filter has no tracking confidence, adaptive scheduling goes by scene activity
+            bounding_boxes.extend(self.kalman_tracker.predict(frame))
+            return
+
+        if self.parallel_tracker is not None:
+            boxes, self.tracker_confidences = self.parallel_tracker.update(rgb_frame)
+            bounding_boxes.extend(boxes)
+            return
+
+        self.tracker_confidences = []
         for tracker in self.crl_trackers:
             # update the tracker, get updated position
-            tracker.crl_tracker.update(rgb_frame)
+            confidence = tracker.crl_tracker.update(rgb_frame)
             new_position = tracker.crl_tracker.get_position()
             
             # add new tracked box
@@ -138,8 +468,35 @@ class VehicleTracker():
             right = int(new_position.right())
             bottom = int(new_position.bottom())
             bounding_boxes.append((tracker.vehicle_class, left, top, right, bottom))
+            self.tracker_confidences.append(confidence)
 
-    def __check_centroids(self, vehicles, class_ids, frame):
+    def __start_renderer(self):
+        outputs = []
+        display = self.settings.verbose if self.settings.display is None else self.settings.display
+        if display == True:
+            outputs.append(WindowOutput())
+        if self.settings.record_path is not None:
+            fps = self.video_stream.get(cv2.CAP_PROP_FPS)
+            outputs.append(RecordingOutput(self.settings.record_path, fps if fps > 0 else 30))
+        if self.settings.preview_port is not None:
+            outputs.append(MjpegOutput(self.settings.preview_port))
+        if len(outputs) == 0:
+            return None
+        renderer = AnnotationRenderer(outputs, self.gate_counter.gates)
+        renderer.start()
+        return renderer
+
+    def __output_frame(self, frame):
+        # returns True when the window asked to stop, drawing and showing happen on the renderer
+        if self.renderer is None:
+            return False
+        start = self.stage_timer.start()
+        vehicles = [(vehicle_id, vehicle.class_name, vehicle.centroids[-1]) for (vehicle_id, vehicle) in self.tracked_vehicles.items()]
+        self.renderer.submit(frame, vehicles)
+        self.stage_timer.lap("output", start)
+        return self.renderer.quit_requested
+
+    def __check_centroids(self, vehicles, class_ids):
         # loop over the tracked objects
         for (vehicle_id, centroid) in vehicles.items():
             # check to see if a trackable object exists for vehicle_id
@@ -150,32 +507,42 @@ class VehicleTracker():
                 vehicle = TrackableVehicle(vehicle_id, class_name, centroid)
             # otherwise, there is a trackable object
             else:
-                # check differences in centroid points and distances
-                y = [c[1] for c in vehicle.centroids]
-                direction = centroid[1] - np.mean(y)
-                vehicle.centroids.append(centroid)
-                # check to see if the object has been counted or not
-                if vehicle.counted == False:
-                    self.__update_vehicle_direction(vehicle, direction, centroid)
+                vehicle.add_centroid(centroid)
 
             # store the trackable object in dictionary
             self.tracked_vehicles[vehicle_id] = vehicle
 
-            if(self.settings.verbose == True):
-                self.__draw_vehicle_on_frame(frame, vehicle_id, self.classifier.class_names[class_ids[vehicle_id]], centroid)
 
-    def __update_vehicle_direction(self, vehicle, direction, centroid):
-        # direction is negative and above mid line
-        if direction < 0 and centroid[1] < self.video_height // 2:
-            vehicle.direction = "up"
-            vehicle.counted = datetime.datetime.now(datetime.timezone.utc)
-            self.logger.insert_vehicle(vehicle)
-            # direction is positive and above mid line
-        elif direction > 0 and centroid[1] > self.video_height // 2:
-            vehicle.direction = "down"
+    def __count_crossings(self) -> None:
+        # every tracked centroid is tested against every gate at once
+        for (vehicle_id, gate, direction) in self.gate_counter.update(self.centroid_tracker.ids, self.centroid_tracker.centroids):
+            self.__update_vehicle_direction(self.tracked_vehicles[vehicle_id], direction)
+
+    def __evict_vehicles(self) -> None:
+        # forget vehicles in step with the centroid tracker so memory stays flat
+        self.gate_counter.forget(self.centroid_tracker.deregistered)
+        for vehicle_id in self.centroid_tracker.deregistered:
+            vehicle = self.tracked_vehicles.pop(vehicle_id, None)
+            if vehicle is not None and self.settings.testing == True:
+                self.finished_vehicles[vehicle_id] = vehicle
+
+    def __update_vehicle_direction(self, vehicle, direction):
+        # a vehicle crossing several gates is logged once per gate
+        vehicle.direction = direction
+        vehicle.counted_frame = self.total_frames_processed
+        if self.live == True:
+            # the time the frame was captured, not when tracking got round to it
+            (captured, capture_start) = self.video_stream.capture_time
+            vehicle.counted = captured
+            latency = time.perf_counter() - capture_start
+            self.stage_timer.lap("capture_to_count", capture_start)
+            self.latency_count += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+        else:
             vehicle.counted = datetime.datetime.now(datetime.timezone.utc)
-            self.logger.insert_vehicle(vehicle)
-        if vehicle.direction != None and self.settings.testing == True:
+        self.logger.insert_vehicle(vehicle)
+        if self.settings.testing == True:
             self.fps.pause()
             check_correct = input(str(vehicle) + "crossed [Correct (y) or False(n)]")
             if check_correct == 'n':
@@ -184,18 +551,3 @@ class VehicleTracker():
                 vehicle.correct = True
             self.fps.resume()
 
-
-    def __draw_vehicle_on_frame(self, frame, vehicle_id, label, centroid) -> None:
-        text = "ID {} {}".format(vehicle_id, label)
-        cv2.putText(frame, text, (centroid[0] - 10, centroid[1] - 10),
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        cv2.circle(frame, (centroid[0], centroid[1]), 4, (0, 255, 0), -1)
-
-    def __display_frame(self, frame):
-        cv2.line(frame, (0, self.video_height // 2), (self.video_width, self.video_height // 2), (0, 255, 255), 2)
-        cv2.imshow("Frame", frame)
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord("q"): 
-            return True
-        else:
-            return False
\ No newline at end of file
@@ -0,0 +1,125 @@
+import os
+import queue
+import threading
+import time
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError, BulkWriteError
+
+SPOOL_PATH = "../data/vehicle-spool.jsonl"
+DUPLICATE_KEY_ERROR = 11000
+# asks the writer thread to flush everything and exit
+STOP = object()
+
+class VehicleLogWriter(threading.Thread):
+    # buffers vehicle events off the frame loop and writes them with insert_many once
+    # batch_size events are waiting or flush_interval seconds have passed. while the
+    # database is unreachable batches go to an append only spool file which is replayed
+    # before the next successful write
+    def __init__(self, collection, spool_path: str = SPOOL_PATH, batch_size: int = 50, flush_interval: float = 2.0,
+                        flush_hooks=None):
+        super().__init__(daemon=True)
+        self.collection = collection
+        # called on the writer thread after every flush, e.g. to push rollup counters
+        self.flush_hooks = flush_hooks or []
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.events = queue.Queue()
+        self.buffered = 0
+        self.total_written = 0
+        self.total_spooled = 0
+        self.last_flush_latency = 0
+        self.spool_lock = threading.Lock()
+
+    def put(self, document) -> None:
+        # ids are set here so replaying a spooled batch can never insert it twice
+        document.setdefault("_id", ObjectId())
+        self.events.put(document)
+
+    def queue_depth(self):
+        return self.events.qsize() + self.buffered
+
+    def stats(self):
+        return {"queueDepth": self.queue_depth(), "lastFlushLatency": self.last_flush_latency,
+            "written": self.total_written, "spooled": self.total_spooled}
+
+    def run(self):
+        buffer = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                document = self.events.get(timeout=timeout)
+                if document is STOP:
+                    break
+                buffer.append(document)
+                self.buffered = len(buffer)
+            except queue.Empty:
+                pass
+
+            if len(buffer) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self.__flush(buffer)
+                buffer = []
+                self.buffered = 0
+                last_flush = time.monotonic()
+
+        self.__flush(buffer)
+        self.buffered = 0
+
+    def __flush(self, documents) -> None:
+        start = time.perf_counter()
+        try:
+            self.__replay_spool()
+            if len(documents) > 0:
+                self.__insert(documents)
+                self.total_written += len(documents)
+        except PyMongoError:
+            self.__spool(documents)
+        for hook in self.flush_hooks:
+            try:
+                hook()
+            except PyMongoError:
+                continue
+        self.last_flush_latency = time.perf_counter() - start
+
+    def __insert(self, documents) -> None:
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # documents already written by an earlier partial attempt are fine
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors) or e.details.get("writeConcernErrors"):
+                raise
+
+    def __spool(self, documents) -> None:
+        if len(documents) == 0:
+            return
+        with self.spool_lock:
+            with open(self.spool_path, "a") as f:
+                for document in documents:
+                    f.write(json_util.dumps(document) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.total_spooled += len(documents)
+
+    def __replay_spool(self) -> None:
+        with self.spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            documents = []
+            with open(self.spool_path, "r") as f:
+                for line in f:
+                    try:
+                        documents.append(json_util.loads(line))
+                    except ValueError:
+                        # a line torn by a crash mid write, nothing to recover
+                        continue
+            if len(documents) > 0:
+                self.__insert(documents)
+                self.total_written += len(documents)
+            os.remove(self.spool_path)
+
+    def stop(self) -> None:
+        self.events.put(STOP)
+        self.join()